@@ -1,14 +1,38 @@
-from flask import Flask, redirect, url_for, session, request, render_template, jsonify
+from flask import Flask, redirect, url_for, session, request, render_template, jsonify, Response, stream_with_context, g, has_request_context
 from functools import wraps
-from msal import ConfidentialClientApplication
+from msal import ConfidentialClientApplication, SerializableTokenCache
 import os
 from dotenv import load_dotenv
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import uuid
 import logging
-import sqlite3
+import json
+import hashlib
+import html
+import re
+import httpx
+import sqlalchemy as sa
 from openai import AzureOpenAI  # Pour Azure OpenAI
+from embedding_cache import EmbeddingCache
+from retrieval import VectorIndex, load_policy_chunks
+from hr_store import HRStore, SQLAlchemyHRStore
+from hr_context import EmployeeContext
+from message_writer import MessageWriter
+from response_cache import ResponseCache
+from llm_dispatch import LLMDispatcher, LLMUnavailableError, INTERACTIVE, BACKGROUND, BULK
+import conversation_memory
+import migrations
+from retention import Retention, delete_in_batches
+from models import db, ArchivedConversation, ChatHistory, Conversation, conversation_title, database_url, engine_options
+from session_store import ServerSideSessionInterface, SQLiteSessionBackend, SQLAlchemySessionBackend, MemorySessionBackend
+from msal_cache import AccountTokenStore, load_http_cache, save_http_cache
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from metrics import Registry
+import time
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # Load environment variables
 load_dotenv()
@@ -27,21 +51,57 @@ for var in required_env_vars:
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 TENANT_ID = os.getenv("TENANT_ID", "common")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
+# AUTHORITY can point to a local stub identity provider for tests
+AUTHORITY = os.getenv("AUTHORITY", f"https://login.microsoftonline.com/{TENANT_ID}")
+CUSTOM_AUTHORITY = "AUTHORITY" in os.environ
 REDIRECT_PATH = "https://127.0.0.1:5000/getAToken"
 SCOPE = ["User.Read"]
+# Returning users are signed in silently for this many days after their last login
+SILENT_LOGIN_DAYS = int(os.getenv("SILENT_LOGIN_DAYS", "14"))
+ACCOUNT_COOKIE = "msal_account"
 completion_model_name = os.getenv("OPENAI_COMPLETION_MODEL")
 embedding_model_name =  os.getenv("OPENAI_EMBEDDING_MODEL")
 
-# Azure OpenAI configuration
+# Azure OpenAI configuration, with one keep-alive connection pool shared by all requests
+openai_http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "200")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+    ),
+    timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "60")), connect=5.0)
+)
 openai_client = AzureOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
     api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    http_client=openai_http_client,
+    max_retries=0  # retried by the dispatcher, under the rate limiter
+)
+
+# Every call goes through the dispatcher: shared in-flight calls, RPM/TPM limits per
+# deployment (this process's share of the quota; 0 disables) and bounded retries
+llm = LLMDispatcher(
+    openai_client,
+    limits={
+        completion_model_name: (int(os.getenv("OPENAI_COMPLETION_RPM", "0")),
+                                int(os.getenv("OPENAI_COMPLETION_TPM", "0"))),
+        embedding_model_name: (int(os.getenv("OPENAI_EMBEDDING_RPM", "0")),
+                               int(os.getenv("OPENAI_EMBEDDING_TPM", "0")))
+    },
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+    max_wait=float(os.getenv("OPENAI_MAX_WAIT", "30")),
+    expected_completion_tokens=int(os.getenv("OPENAI_EXPECTED_COMPLETION_TOKENS", "500")),
+    count_tokens=conversation_memory.count_tokens
 )
 
 # Flask app configuration
-app = Flask(__name__, template_folder="../frontend/templates", static_folder="../frontend/static")
+# INSTANCE_PATH moves every local database and cache file, e.g. for benchmarks
+app = Flask(
+    __name__,
+    template_folder="../frontend/templates",
+    static_folder="../frontend/static",
+    instance_path=os.getenv("INSTANCE_PATH")
+)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 app.config.update(
     SESSION_COOKIE_SECURE=True,
@@ -50,26 +110,218 @@ app.config.update(
     PERMANENT_SESSION_LIFETIME=3600
 )
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///chat_history.db"
+# Session data lives server-side; the cookie only carries a signed session id
+# (SESSION_BACKEND=database shares them between nodes through the chat database)
+os.makedirs(app.instance_path, exist_ok=True)
+if os.getenv("SESSION_BACKEND", "sqlite") == "memory":
+    session_backend = MemorySessionBackend()
+elif os.getenv("SESSION_BACKEND") == "database":
+    session_database_url = database_url(app.instance_path)
+    session_backend = SQLAlchemySessionBackend(session_database_url, engine_options(session_database_url))
+else:
+    session_backend = SQLiteSessionBackend(os.path.join(app.instance_path, "sessions.db"))
+app.session_interface = ServerSideSessionInterface(
+    session_backend,
+    cache_size=int(os.getenv("SESSION_CACHE_SIZE", "1024")),
+    sweep_interval=int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+)
+
+# Configure the database: SQLite in the instance folder by default, or any
+# SQLAlchemy URL (e.g. postgresql+psycopg2://...) shared by every node
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url(app.instance_path)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db = SQLAlchemy(app)
+db.init_app(app)
+
+with app.app_context():
+    # WAL lets readers proceed while the background writer commits
+    if db.engine.dialect.name == "sqlite":
+        @db.event.listens_for(db.engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # Only takes effect on a new database; see retention.py for existing ones
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+
+    @db.event.listens_for(db.engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.inc()
+        if has_request_context() and "db_queries" in g:
+            g.db_queries += 1
+
+# Persistent cache so identical employee rows and policy chunks are embedded only once
+embedding_cache = EmbeddingCache(
+    os.path.join(app.instance_path, "embedding_cache.db"),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+    hot_entries=int(os.getenv("EMBEDDING_CACHE_HOT_ENTRIES", "2048")),
+    max_batch_inputs=int(os.getenv("EMBEDDING_BATCH_INPUTS", "2048")),
+    max_batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000")),
+    count_tokens=conversation_memory.count_tokens
+)
+# Queries get their own table and budget: a stream of one-off questions must not
+# evict the policy vectors the index is rebuilt from
+query_embedding_cache = EmbeddingCache(
+    os.path.join(app.instance_path, "embedding_cache.db"),
+    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "20000")),
+    hot_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_HOT_ENTRIES", "1024")),
+    count_tokens=conversation_memory.count_tokens,
+    table="query_embeddings"
+)
+
+# HR database access: pooled read-only connections and a TTL cache per email.
+# HR_DATABASE_URL points every node at a shared HR database instead of the local file
+if os.getenv("HR_DATABASE_URL"):
+    hr_database_url = database_url(app.instance_path, env_var="HR_DATABASE_URL", default_file="rh_database.db")
+    hr_store = SQLAlchemyHRStore(
+        hr_database_url,
+        cache_ttl=int(os.getenv("HR_CACHE_TTL", "300")),
+        engine_options=engine_options(hr_database_url),
+        cache_max_entries=int(os.getenv("HR_CACHE_MAX_ENTRIES", "10000"))
+    )
+else:
+    hr_store = HRStore(
+        os.path.join(app.instance_path, "rh_database.db"),
+        cache_ttl=int(os.getenv("HR_CACHE_TTL", "300")),
+        pool_size=int(os.getenv("HR_POOL_SIZE", "8")),
+        cache_max_entries=int(os.getenv("HR_CACHE_MAX_ENTRIES", "10000"))
+    )
+
+# Compact employee records for the prompt, rendered once per row version
+employee_context = EmployeeContext(max_entries=int(os.getenv("EMPLOYEE_CONTEXT_CACHE_ENTRIES", "10000")))
+
+# Retrieval settings: only the top-k employee rows and policy chunks reach the prompt
+HR_POLICY_DIR = os.getenv("HR_POLICY_DIR", os.path.join(app.instance_path, "policies"))
+RETRIEVAL_TOP_K_ROWS = int(os.getenv("RETRIEVAL_TOP_K_ROWS", "3"))
+RETRIEVAL_TOP_K_POLICIES = int(os.getenv("RETRIEVAL_TOP_K_POLICIES", "4"))
+RETRIEVAL_INDEX_MODE = os.getenv("RETRIEVAL_INDEX_MODE", "flat")  # 'flat' or 'ivf'
+RETRIEVAL_QUANTIZE = os.getenv("RETRIEVAL_QUANTIZE", "false").lower() == "true"
+
+# Built in the background at startup; answers go without policy context until then
+policy_index = None
+
+# Number of messages rendered with /chatbot and returned per /chat_history page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+
+# Token budget for previous turns sent along with each query
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Old turns are folded into the summary off the request path, one fold per conversation at a time
+summary_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUMMARY_WORKERS", "2")), thread_name_prefix="summarizer"
+)
+summaries_in_progress = set()
+summaries_lock = threading.Lock()
+
+# Semantic cache of answers, scoped to the employee rows used as context
+response_cache = ResponseCache(
+    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+)
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Define the ChatHistory model
-class ChatHistory(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(36), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    sender = db.Column(db.String(10), nullable=False)  # 'user' or 'assistant'
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+# Prometheus metrics, served at /metrics
+metrics = Registry(
+    multiprocess_dir=os.getenv("PROMETHEUS_MULTIPROC_DIR"),
+    write_interval=float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+)
+if metrics.multiprocess_dir:
+    metrics.start_writer()
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time to produce the response headers", ["endpoint", "method", "status"]
+)
+STAGE_SECONDS = metrics.histogram(
+    "process_input_stage_seconds", "Time spent in each stage of /process_input", ["stage"]
+)
+DB_QUERIES_PER_REQUEST = metrics.histogram(
+    "db_queries_per_request", "Chat database queries issued while serving a request", ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_QUERIES = metrics.counter("db_queries_total", "Chat database queries, including background writes")
+OPENAI_TOKENS = metrics.counter("openai_tokens_total", "Tokens reported by Azure OpenAI", ["model", "type"])
+CACHES = (
+    ("embedding", embedding_cache), ("query_embedding", query_embedding_cache), ("hr", hr_store), ("response", response_cache),
+    ("employee_context", employee_context)
+)
+metrics.gauge(
+    "cache_hit_ratio", "Hit ratio of each cache since the process started",
+    lambda: [((name,), cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0)
+             for name, cache in CACHES],
+    ["cache"]
+)
+metrics.callback_counter(
+    "cache_lookups_total", "Cache lookups, by result",
+    lambda: [((name, "hit"), cache.hits) for name, cache in CACHES]
+            + [((name, "miss"), cache.misses) for name, cache in CACHES],
+    ["cache", "result"]
+)
+metrics.callback_counter(
+    "openai_dispatch_events_total", "Coalesced, retried and rejected Azure OpenAI calls",
+    lambda: [(("coalesced",), llm.coalesced), (("retried",), llm.retries), (("rejected",), llm.rejected)],
+    ["event"]
+)
+metrics.gauge(
+    "openai_dispatch_waiting", "Azure OpenAI calls waiting for rate limit capacity",
+    lambda: [((model,), limiter.waiting) for model, limiter in llm.limiters.items()],
+    ["model"]
+)
+metrics.callback_counter(
+    "chat_retention_conversations_total", "Conversations archived, restored and purged",
+    lambda: [(("archived",), retention.archived), (("restored",), retention.restored),
+             (("purged",), retention.purged)],
+    ["event"]
+)
+metrics.callback_counter(
+    "chat_messages_dropped_total", "Chat messages dropped because the database rejected them",
+    lambda: [((), message_writer.dropped)]
+)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Ask for token usage on streamed completions (Azure API version 2024-09-01-preview or later)
+OPENAI_STREAM_USAGE = os.getenv("OPENAI_STREAM_USAGE", "false").lower() == "true"
+
+def record_usage(model, usage):
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, model=model, type="prompt")
+    # Embedding responses only report prompt tokens
+    if getattr(usage, "completion_tokens", None) is not None:
+        OPENAI_TOKENS.inc(usage.completion_tokens, model=model, type="completion")
+
+# Full-text search over ChatHistory.message: an FTS5 table on SQLite, a tsvector
+# column on PostgreSQL; both are created by migrations
+search_backend = None
 
-# Create the database tables
+# Bring the schema up to date; multi-node deployments run `python migrations.py`
+# once per release and set AUTO_MIGRATE=false
 with app.app_context():
-    db.create_all()
+    if os.getenv("AUTO_MIGRATE", "true").lower() == "true":
+        migrations.run_migrations(db.engine)
+    search_backend = migrations.search_backend(db.engine)
+
+# System prompt sent with every chat completion
+SYSTEM_INSTRUCTIONS = """
+You are an HR assistant chatbot designed to help employees with their HR-related questions.
+
+Your capabilities:
+1. Access employee data like salary, position, department, and leave balance
+2. Answer questions about company policies and procedures
+3. Provide information on benefits, time off, and other HR matters
+4. Maintain complete confidentiality of all employee information
+
+When responding:
+- Be professional, concise, and helpful
+- Answer only questions related to HR matters
+- For sensitive information, verify you're responding to the correct employee
+- If you don't know something, say so rather than making up information
+- Use the employee data provided in context for personalized responses
+
+Remember that all information shared is confidential and should only be disclosed to the authenticated user it belongs to.
+"""
 
 # Decorator for login-required routes
 def login_required(f):
@@ -80,12 +332,94 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# MSAL application instance
-msal_app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-) 
+def current_user_id():
+    user = session.get("user", {})
+    return user.get("oid") or user.get("preferred_username")
+
+# Tenant metadata is persisted in the instance folder and shared by every
+# worker, so discovery happens once and building an MSAL client is cheap
+msal_http_cache_path = os.path.join(app.instance_path, "msal_http_cache.bin")
+msal_http_cache = load_http_cache(msal_http_cache_path)
+
+def build_msal_app(token_cache=None):
+    return ConfidentialClientApplication(
+        client_id=CLIENT_ID,
+        client_credential=CLIENT_SECRET,
+        authority=AUTHORITY,
+        token_cache=token_cache,
+        http_cache=msal_http_cache,
+        validate_authority=not CUSTOM_AUTHORITY,
+        instance_discovery=not CUSTOM_AUTHORITY,
+        verify=os.getenv("AUTHORITY_CA_BUNDLE") or True
+    )
+
+# Only builds authorization URLs; each login gets a client holding the tokens of its own account
+msal_app = build_msal_app()
+save_http_cache(msal_http_cache_path, msal_http_cache)
+atexit.register(save_http_cache, msal_http_cache_path, msal_http_cache)
+msal_token_store = AccountTokenStore(
+    os.path.join(app.instance_path, "msal_token_cache.db"),
+    max_idle_days=SILENT_LOGIN_DAYS,
+    sweep_interval=int(os.getenv("TOKEN_CACHE_SWEEP_INTERVAL", "3600"))
+)
+
+account_serializer = URLSafeTimedSerializer(app.secret_key, salt="msal-account")
+
+def remembered_account_id():
+    # The cookie only names the account; its tokens never leave the server-side store
+    cookie = request.cookies.get(ACCOUNT_COOKIE)
+    if not cookie or not SILENT_LOGIN_DAYS:
+        return None
+    try:
+        return account_serializer.loads(cookie, max_age=SILENT_LOGIN_DAYS * 86400)
+    except BadSignature:
+        return None
+
+def start_user_session(claims):
+    # New session id on login so a pre-login id cannot be reused
+    session.regenerate()
+    session.pop("state", None)
+    session["user"] = claims
+
+    # Generate a new session ID for chat history
+    session["session_id"] = str(uuid.uuid4())
+    logging.info(f"New session ID generated: {session['session_id']}")
+
+    user_email = claims.get("preferred_username")
+
+    # Warm the HR cache so the first chat request does not hit rh_database.db
+    if user_email:
+        try:
+            rows = hr_store.get_employee_rows(user_email)
+            if rows:
+                logging.info(f"Fetched {len(rows)} rows from rh_database.db for user {user_email}")
+            else:
+                logging.warning(f"No data found in rh_database.db for user {user_email}")
+        except Exception as e:
+            logging.error(f"Failed to fetch data from rh_database.db: {e}")
+            logging.error(f"Database path attempted: {hr_store.db_path}")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" in g:
+        endpoint = request.endpoint or "unknown"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - g.request_start,
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+        DB_QUERIES_PER_REQUEST.observe(g.db_queries, endpoint=endpoint)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
@@ -95,6 +429,24 @@ def index():
 
 @app.route("/login")
 def login():
+    # Returning users with a cached refresh token skip the identity provider round-trip
+    home_account_id = remembered_account_id()
+    if home_account_id:
+        token_cache = msal_token_store.load(home_account_id)
+        client = build_msal_app(token_cache)
+        account = next((a for a in client.get_accounts() if a.get("home_account_id") == home_account_id), None)
+        result = client.acquire_token_silent(SCOPE, account=account) if account else None
+        if result and "access_token" in result:
+            msal_token_store.save(home_account_id, token_cache)
+            claims = result.get("id_token_claims") or {
+                "preferred_username": account.get("username"),
+                "oid": account.get("local_account_id"),
+                "name": account.get("username")
+            }
+            start_user_session(claims)
+            logging.info(f"Silent login for {claims.get('preferred_username')}")
+            return redirect(url_for("chatbot"))
+
     session["state"] = os.urandom(16).hex()  # Generate state for CSRF protection
     auth_url = msal_app.get_authorization_request_url(
         scopes=SCOPE,
@@ -115,7 +467,9 @@ def authorized():
         if not code:
             return "No auth code provided", 400
 
-        result = msal_app.acquire_token_by_authorization_code(
+        token_cache = SerializableTokenCache()
+        client = build_msal_app(token_cache)
+        result = client.acquire_token_by_authorization_code(
             code=code,
             scopes=SCOPE,
             redirect_uri=url_for("authorized", _external=True)
@@ -124,56 +478,40 @@ def authorized():
         if "error" in result:
             return f"Token acquisition failed: {result.get('error_description')}", 401
 
-        session["user"] = result.get("id_token_claims")
-        
-        # Generate a new session ID for chat history
-        session["session_id"] = str(uuid.uuid4())
-        logging.info(f"New session ID generated: {session['session_id']}")
+        claims = result.get("id_token_claims")
+        start_user_session(claims)
 
-        # Load chat history for the logged-in user's email
-        user_email = session["user"].get("preferred_username")
-        if user_email:
-            user_chat_history = ChatHistory.query.filter_by(session_id=session["session_id"]).all()
-            session["chat_history"] = [
-                            {"message": msg.message, "sender": msg.sender, "timestamp": msg.timestamp}
-                            for msg in user_chat_history
-                        ]
-            logging.info(f"Loaded {len(session['chat_history'])} messages for user {user_email}")
-        
-        # Fetch rows from rh_database.db where email matches the user's email
-        if user_email:
-            try:
-                # Use absolute path for the database connection
-                db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "rh_database.db")
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM employees WHERE email = ?", (user_email,))
-                rows = cursor.fetchall()
-                column_names = [description[0] for description in cursor.description]
-                if rows:
-                    logging.info(f"Fetched {len(rows)} rows from rh_database.db for user {user_email}")
-                else:
-                    logging.warning(f"No data found in rh_database.db for user {user_email}")
-            except Exception as e:
-                logging.error(f"Failed to fetch data from rh_database.db: {e}")
-                logging.error(f"Database path attempted: {db_path}")
-            finally:
-                if 'conn' in locals() and conn:
-                    conn.close()
-                    
-
-        return redirect(url_for("chatbot"))
+        response = redirect(url_for("chatbot"))
+        accounts = client.get_accounts()
+        if accounts and SILENT_LOGIN_DAYS:
+            home_account_id = accounts[0]["home_account_id"]
+            msal_token_store.save(home_account_id, token_cache)
+            response.set_cookie(
+                ACCOUNT_COOKIE,
+                account_serializer.dumps(home_account_id),
+                max_age=SILENT_LOGIN_DAYS * 86400,
+                secure=True,
+                httponly=True,
+                samesite="Lax"
+            )
+        return response
     except Exception as e:
         logging.error(f"Error during authorization: {e}")
         return "An error occurred during authorization", 500 
 
 @app.route("/logout")
 def logout():
+    # Forget cached tokens too, otherwise the next /login would be silent
+    home_account_id = remembered_account_id()
+    if home_account_id:
+        msal_token_store.delete(home_account_id)
     session.clear()
-    return redirect(
+    response = redirect(
         f"{AUTHORITY}/oauth2/v2.0/logout?"
         f"post_logout_redirect_uri={url_for('index', _external=True)}"
     )
+    response.delete_cookie(ACCOUNT_COOKIE)
+    return response
 
 @app.route("/chatbot")
 @login_required
@@ -183,36 +521,197 @@ def chatbot():
         session["session_id"] = str(uuid.uuid4())
         logging.info(f"New session ID generated: {session['session_id']}")
 
-    # Get chat history for this session
-    chat_history = get_chat_history(session["session_id"])
+    # Render only the latest page; older messages are fetched from /chat_history on scroll
+    chat_history, has_more = get_chat_history_page(session["session_id"], limit=HISTORY_PAGE_SIZE)
     user_name = session.get("user", {}).get("name", "User")
     
     # If no preferred_username is available, try name or fallback to "User"
     if not user_name:
         user_name = session.get("user", {}).get("preferred_username", "User")
     
-    return render_template("chatbot.html", user_name=user_name, chat_history=chat_history)
+    return render_template("chatbot.html", user_name=user_name, chat_history=chat_history, has_more_history=has_more)
+
+def touch_conversation(session_id, user_id, message, sender, timestamp):
+    conversation = db.session.get(Conversation, session_id)
+    if conversation is None:
+        db.session.add(Conversation(
+            session_id=session_id,
+            user_id=user_id,
+            title=conversation_title(message),
+            title_from_user=sender == "user",
+            created_at=timestamp,
+            last_timestamp=timestamp
+        ))
+        return
+    conversation.last_timestamp = timestamp
+    # Prefer the first user message as title over an assistant greeting
+    if sender == "user" and not conversation.title_from_user:
+        conversation.title = conversation_title(message)
+        conversation.title_from_user = True
+
+def persist_messages(batch):
+    # Runs on the writer thread: one transaction per batch
+    with app.app_context():
+        try:
+            db.session.add_all(
+                ChatHistory(
+                    session_id=m["session_id"], user_id=m["user_id"], message=m["message"],
+                    sender=m["sender"], timestamp=m["timestamp"]
+                )
+                for m in batch
+            )
+            for m in batch:
+                touch_conversation(m["session_id"], m["user_id"], m["message"], m["sender"], m["timestamp"])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-def save_message(session_id, message, sender):
+def permanent_write_error(error):
+    # Data the database rejects (constraint, value, or a parameter the driver
+    # cannot bind: psycopg2 raises a bare ValueError for a NUL character), as
+    # opposed to an outage or a lock
+    if isinstance(error, (sa.exc.IntegrityError, sa.exc.DataError, ValueError)):
+        return True
+    return isinstance(error, sa.exc.StatementError) and not isinstance(error, sa.exc.DBAPIError)
+
+# Messages are buffered and committed in batches by a background thread
+message_writer = MessageWriter(
+    persist_messages,
+    batch_size=int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.5")),
+    max_attempts=int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", "5")),
+    max_pending=int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000")),
+    is_permanent=permanent_write_error
+)
+# How long clearing a chat waits for its buffered messages to be written
+CHAT_FLUSH_TIMEOUT = float(os.getenv("CHAT_FLUSH_TIMEOUT", "5"))
+atexit.register(message_writer.stop)
+
+# Idle conversations move to monthly compressed archives and come back when opened;
+# 0 days disables a policy, RETENTION_INTERVAL=0 leaves the job to cron
+CHAT_DELETE_BATCH_SIZE = int(os.getenv("CHAT_DELETE_BATCH_SIZE", "1000"))
+with app.app_context():
+    retention = Retention(
+        db.engine,
+        os.getenv("ARCHIVE_DIR", os.path.join(app.instance_path, "archive")),
+        archive_after_days=int(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", "0")),
+        purge_after_days=int(os.getenv("RETENTION_PURGE_AFTER_DAYS", "0")),
+        batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "200")),
+        vacuum_pages=int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+    )
+if int(os.getenv("RETENTION_INTERVAL", "3600")):
+    retention.start(int(os.getenv("RETENTION_INTERVAL", "3600")))
+
+def save_message(session_id, user_id, message, sender):
     try:
-        new_message = ChatHistory(session_id=session_id, message=message, sender=sender)
-        db.session.add(new_message)
-        db.session.commit()
-        logging.info(f"Message saved: {message[:30]}... (Sender: {sender})")
+        message_writer.enqueue({
+            "session_id": session_id,
+            "user_id": user_id,
+            "message": message,
+            "sender": sender,
+            "timestamp": datetime.utcnow()
+        })
+        if has_request_context():
+            g.setdefault("written_sessions", set()).add(session_id)
         return True
     except Exception as e:
-        db.session.rollback()
         logging.error(f"Failed to save message: {e}")
         return False
 
-def get_chat_history(session_id):
+def commit_messages(session_ids):
+    # The next request of this user may be served by another worker, which cannot
+    # see this one's buffer: a response that wrote messages ends once they are committed
+    for session_id in session_ids:
+        if not message_writer.flush_session(session_id, timeout=CHAT_FLUSH_TIMEOUT):
+            logging.warning(f"Messages of session {session_id} are still buffered after {CHAT_FLUSH_TIMEOUT}s")
+
+@app.after_request
+def commit_written_messages(response):
+    # Streamed responses commit at the end of their body instead
+    if not response.is_streamed:
+        commit_messages(g.pop("written_sessions", ()))
+    return response
+
+def get_chat_history(session_id, after=None):
     try:
-        messages = ChatHistory.query.filter_by(session_id=session_id).order_by(ChatHistory.timestamp).all()
-        return [{"message": msg.message, "sender": msg.sender, "timestamp": msg.timestamp} for msg in messages]
+        # Snapshot the buffer first: a batch committed meanwhile shows up in both lists
+        pending = message_writer.pending_for(session_id)
+        query = ChatHistory.query.filter_by(session_id=session_id)
+        if after is not None:
+            query = query.filter(ChatHistory.timestamp > after)
+            pending = [m for m in pending if m["timestamp"] > after]
+        messages = query.order_by(ChatHistory.timestamp, ChatHistory.id).all()
+        history = [{"message": msg.message, "sender": msg.sender, "timestamp": msg.timestamp} for msg in messages]
+        persisted = {(msg["timestamp"], msg["sender"], msg["message"]) for msg in history}
+        history += [
+            {"message": m["message"], "sender": m["sender"], "timestamp": m["timestamp"]}
+            for m in pending
+            if (m["timestamp"], m["sender"], m["message"]) not in persisted
+        ]
+        return history
     except Exception as e:
         logging.error(f"Failed to fetch chat history for session {session_id}: {e}")
         return []
 
+def history_page_query(session_id, before_id=None, limit=HISTORY_PAGE_SIZE):
+    # Keyset pagination on the primary key, newest first
+    query = db.select(ChatHistory).where(ChatHistory.session_id == session_id)
+    if before_id is not None:
+        query = query.where(ChatHistory.id < before_id)
+    return query.order_by(ChatHistory.id.desc()).limit(limit)
+
+def get_chat_history_page(session_id, before_id=None, limit=HISTORY_PAGE_SIZE):
+    # Returns the page in chronological order and whether older messages exist
+    try:
+        # Buffered messages are newer than anything persisted: they belong to the first page
+        pending = message_writer.pending_for(session_id) if before_id is None else []
+        rows = db.session.scalars(history_page_query(session_id, before_id, limit + 1)).all()
+        has_more = len(rows) > limit
+        history = [
+            {"id": msg.id, "message": msg.message, "sender": msg.sender, "timestamp": msg.timestamp}
+            for msg in reversed(rows[:limit])
+        ]
+        persisted = {(msg["timestamp"], msg["sender"], msg["message"]) for msg in history}
+        history += [
+            {"id": None, "message": m["message"], "sender": m["sender"], "timestamp": m["timestamp"]}
+            for m in pending
+            if (m["timestamp"], m["sender"], m["message"]) not in persisted
+        ]
+        return history, has_more
+    except Exception as e:
+        logging.error(f"Failed to fetch chat history for session {session_id}: {e}")
+        return [], False
+
+@app.route("/chat_history", methods=["GET"])
+@login_required
+def chat_history_page():
+    session_id = session.get("session_id")
+    before_id = request.args.get("before", type=int)
+    limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), 200)
+    if not session_id:
+        return jsonify({"error": "No active session"}), 400
+
+    query = history_page_query(session_id, before_id, limit + 1).execution_options(yield_per=100)
+
+    # Rows are serialized one by one as the cursor yields them, newest first
+    def generate():
+        yield '{"status": "success", "messages": ['
+        count = 0
+        for msg in db.session.scalars(query):
+            count += 1
+            if count > limit:
+                break
+            yield ("," if count > 1 else "") + json.dumps({
+                "id": msg.id,
+                "message": msg.message,
+                "sender": msg.sender,
+                "timestamp": msg.timestamp.isoformat()
+            })
+        yield f'], "has_more": {json.dumps(count > limit)}}}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
 @app.route("/send_message", methods=["POST"])
 @login_required
 def send_message():
@@ -230,7 +729,7 @@ def send_message():
             logging.info(f"Generated new session ID: {session_id}")
             
         # Save user message
-        if not save_message(session_id, user_message, "user"):
+        if not save_message(session_id, current_user_id(), user_message, "user"):
             return jsonify({"error": "Failed to save message"}), 500
         
         # Process the message and generate a response
@@ -238,7 +737,7 @@ def send_message():
         assistant_response = f"I received your message: '{user_message}'. This is a placeholder response."
         
         # Save assistant response
-        if not save_message(session_id, assistant_response, "assistant"):
+        if not save_message(session_id, current_user_id(), assistant_response, "assistant"):
             return jsonify({"error": "Failed to save assistant response"}), 500
         
         return jsonify({
@@ -257,8 +756,16 @@ def clear_chat():
         if not session_id:
             return jsonify({"error": "No active session"}), 400
             
-        # Delete all messages for this session
-        ChatHistory.query.filter_by(session_id=session_id).delete()
+        # Delete all messages for this session, including buffered ones
+        if not message_writer.flush(timeout=CHAT_FLUSH_TIMEOUT):
+            return jsonify({"error": "Chat history is busy, try again shortly"}), 503
+        user_id = current_user_id()
+        delete_in_batches(
+            db.engine, ChatHistory.__table__,
+            db.and_(ChatHistory.session_id == session_id, ChatHistory.user_id == user_id),
+            CHAT_DELETE_BATCH_SIZE
+        )
+        Conversation.query.filter_by(session_id=session_id, user_id=user_id).delete()
         db.session.commit()
         
         # Generate a new session ID
@@ -290,86 +797,288 @@ def process_input():
             session["session_id"] = str(uuid.uuid4())
             session_id = session["session_id"]
 
+        # Load the turns that are not folded into the conversation summary yet
+        with STAGE_SECONDS.time(stage="chat_history"):
+            conversation = db.session.get(Conversation, session_id)
+            previous_turns = get_chat_history(
+                session_id, after=conversation.summarized_until if conversation else None
+            )
+
         # Save user message
-        save_message(session_id, user_query, "user")
+        user_id = current_user_id()
+        with STAGE_SECONDS.time(stage="persistence"):
+            if not save_message(session_id, user_id, user_query, "user"):
+                return jsonify({"error": "Failed to save message"}), 500
 
         # Fetch rows from rh_database.db where email matches the user's email
         try:
-            db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "rh_database.db")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM employees WHERE email = ?", (user_email,))
-            rows = cursor.fetchall()
-            column_names = [description[0] for description in cursor.description]
-            conn.close()
+            with STAGE_SECONDS.time(stage="hr_lookup"):
+                rows_with_columns = hr_store.get_employee_rows(user_email)
         except Exception as e:
             logging.error(f"Failed to fetch data from rh_database.db: {e}")
-            logging.error(f"Database path attempted: {db_path}")
+            logging.error(f"Database path attempted: {hr_store.db_path}")
             return jsonify({"error": "Failed to fetch data"}), 500
 
-        if not rows:
+        if not rows_with_columns:
             return jsonify({"error": "No relevant data found"}), 404
 
-        # Prepare rows with column names for AI processing
-        rows_with_columns = [
-            {column_names[i]: row[i] for i in range(len(column_names))}
-            for row in rows
-        ]
-        
-        # Convert row dictionaries to strings for embedding
-        row_strings = [str(row) for row in rows_with_columns]
-        
-        # Updated to use new OpenAI client syntax with proper input format
-        embedding_response = openai_client.embeddings.create(
-            input=row_strings,  # Now passing strings as expected by the API
-            model=embedding_model_name
-        )
-        embeddings = [item.embedding for item in embedding_response.data]
+        # Rows are embedded with every column, so their embeddings do not depend on the
+        # question; the prompt only gets the columns the question is about
+        row_strings = [employee_context.render(row) for row in rows_with_columns]
+        columns = employee_context.columns_for(user_query)
+        row_texts = [employee_context.render(row, columns) for row in rows_with_columns]
 
-        # Replace the simple "instructions" placeholder with a comprehensive system prompt
-        system_instructions = """
-        You are an HR assistant chatbot designed to help employees with their HR-related questions.
+        with STAGE_SECONDS.time(stage="embedding"):
+            # Only rows that were never embedded before reach the embeddings API
+            embeddings = embedding_cache.get_many(row_strings, embedding_model_name, embed_texts)
 
-        Your capabilities:
-        1. Access employee data like salary, position, department, and leave balance
-        2. Answer questions about company policies and procedures
-        3. Provide information on benefits, time off, and other HR matters
-        4. Maintain complete confidentiality of all employee information
+            # Normalized queries share embeddings, so repeated questions cost no API call
+            normalized_query = normalize_query(user_query)
+            query_embedding = query_embedding_cache.get_many([normalized_query], embedding_model_name, embed_texts)[0]
 
-        When responding:
-        - Be professional, concise, and helpful
-        - Answer only questions related to HR matters
-        - For sensitive information, verify you're responding to the correct employee
-        - If you don't know something, say so rather than making up information
-        - Use the employee data provided in context for personalized responses
+        # Answer near-identical questions about the same data from the cache; follow-ups
+        # depend on the earlier turns, so only opening questions are cached
+        context_hash = hashlib.sha256("\n".join(row_strings).encode("utf-8")).hexdigest()
+        cache_key = (context_hash, completion_model_name)
+        use_cache = not previous_turns and not (conversation and conversation.summary)
+        with STAGE_SECONDS.time(stage="response_cache"):
+            cached_response = response_cache.lookup(query_embedding, cache_key) if use_cache else None
+        if cached_response is not None:
+            with STAGE_SECONDS.time(stage="persistence"):
+                save_message(session_id, user_id, cached_response, "assistant")
+            if data.get("stream"):
+                return stream_text(cached_response)
+            return jsonify({
+                "status": "success",
+                "response": cached_response
+            })
 
-        Remember that all information shared is confidential and should only be disclosed to the authenticated user it belongs to.
-        """
+        # Keep only the rows and policy chunks closest to the query
+        with STAGE_SECONDS.time(stage="retrieval"):
+            context = retrieve_context(query_embedding, row_texts, embeddings)
 
-        # Use OpenAI Chat Completion to generate a response
-        chat_completion = openai_client.chat.completions.create(
-            model=completion_model_name,
-            messages=[
-                {"role": "system", "content": system_instructions},
-                {"role": "user", "content": f"User query: {user_query}\nContext: {rows_with_columns}"}
-            ]
+        # Recent turns within the token budget, older ones through the rolling summary
+        with STAGE_SECONDS.time(stage="memory"):
+            summary, recent_turns = conversation_context(session_id, conversation, previous_turns)
+        messages = conversation_memory.build_messages(
+            SYSTEM_INSTRUCTIONS, summary, recent_turns,
+            f"User query: {user_query}\nContext:\n{context}"
         )
 
-        assistant_response = chat_completion.choices[0].message.content
+        # Stream the answer token by token when the client asks for it
+        if data.get("stream"):
+            return stream_completion(
+                session_id, user_id, messages,
+                on_complete=(lambda response: response_cache.store(query_embedding, cache_key, response))
+                if use_cache else None
+            )
 
+        # Use OpenAI Chat Completion to generate a response
+        with STAGE_SECONDS.time(stage="completion"):
+            chat_completion = llm.chat(completion_model_name, messages, priority=INTERACTIVE)
+        record_usage(completion_model_name, chat_completion.usage)
+
+        assistant_response = chat_completion.choices[0].message.content
+        if use_cache:
+            response_cache.store(query_embedding, cache_key, assistant_response)
 
-        
         # Save assistant response
-        save_message(session_id, assistant_response, "assistant")
+        with STAGE_SECONDS.time(stage="persistence"):
+            save_message(session_id, user_id, assistant_response, "assistant")
 
         return jsonify({
             "status": "success",
             "response": assistant_response
         })
+    except LLMUnavailableError as e:
+        logging.warning(f"Azure OpenAI unavailable in process_input: {e}")
+        retry_after = max(1, round(e.retry_after or 1))
+        return jsonify({
+            "error": f"The assistant is busy, please try again in {retry_after} seconds"
+        }), e.status, {"Retry-After": str(retry_after)}
     except Exception as e:
         logging.error(f"Error in process_input: {e}")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+def complete_text(messages):
+    # Only the summarizer pool calls this, off the request path, so it can wait
+    # for quota behind interactive answers
+    chat_completion = llm.chat(completion_model_name, messages, priority=BACKGROUND)
+    record_usage(completion_model_name, chat_completion.usage)
+    return chat_completion.choices[0].message.content
+
+def conversation_context(session_id, conversation, turns):
+    # Answers use the summary as it is now; turns past the budget are left out
+    # of this prompt and folded into the summary in the background
+    summary = conversation.summary if conversation else None
+    to_fold, recent_turns = conversation_memory.split_turns(
+        turns, CONTEXT_TOKEN_BUDGET, completion_model_name
+    )
+    if to_fold:
+        with summaries_lock:
+            if session_id in summaries_in_progress:
+                return summary, recent_turns
+            summaries_in_progress.add(session_id)
+        summarized_until = conversation.summarized_until if conversation else None
+        summary_executor.submit(fold_summary, session_id, summary, summarized_until, to_fold)
+    return summary, recent_turns
+
+def fold_summary(session_id, summary, summarized_until, to_fold):
+    try:
+        with app.app_context():
+            try:
+                new_summary = conversation_memory.summarize(summary, to_fold, complete_text)
+                # Only replace the summary this fold started from
+                Conversation.query.filter(
+                    Conversation.session_id == session_id,
+                    Conversation.summarized_until.is_(None) if summarized_until is None
+                    else Conversation.summarized_until == summarized_until
+                ).update({
+                    Conversation.summary: new_summary,
+                    Conversation.summarized_until: to_fold[-1]["timestamp"]
+                }, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Failed to summarize conversation {session_id}: {e}")
+    finally:
+        with summaries_lock:
+            summaries_in_progress.discard(session_id)
+
+def embed_texts(texts, priority=INTERACTIVE):
+    embedding_response = llm.embed(embedding_model_name, texts, priority=priority)
+    record_usage(embedding_model_name, embedding_response.usage)
+    return [item.embedding for item in embedding_response.data]
+
+def build_policy_index():
+    # Policy chunk embeddings come from the persistent cache, so a restart only
+    # embeds new or changed chunks; failures are retried with backoff
+    global policy_index
+    delay = 5
+    while True:
+        try:
+            chunks = load_policy_chunks(HR_POLICY_DIR)
+            embed_fn = partial(embed_texts, priority=BULK)
+            vectors = embedding_cache.get_many(chunks, embedding_model_name, embed_fn) if chunks else []
+            policy_index = VectorIndex(
+                vectors, chunks,
+                mode=RETRIEVAL_INDEX_MODE if len(chunks) > 1000 else "flat",
+                quantize=RETRIEVAL_QUANTIZE
+            )
+            logging.info(f"Policy index ready with {len(chunks)} chunks")
+            return
+        except Exception as e:
+            logging.error(f"Failed to build the policy index, retrying in {delay}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 300)
+
+threading.Thread(target=build_policy_index, name="policy-index", daemon=True).start()
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def retrieve_context(query_embedding, row_texts, row_embeddings):
+    # Rows are always restricted to the authenticated employee before ranking
+    row_hits = VectorIndex(row_embeddings, row_texts).search([query_embedding], k=RETRIEVAL_TOP_K_ROWS)[0]
+    index = policy_index
+    policy_hits = index.search([query_embedding], k=RETRIEVAL_TOP_K_POLICIES)[0] if index is not None else []
+
+    sections = ["Employee data:"] + [text for _, text in row_hits]
+    if policy_hits:
+        sections += ["", "HR policies:"] + [text for _, text in policy_hits]
+    return "\n".join(sections)
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+def stream_text(text):
+    # Same event format as stream_completion, for answers that are already known
+    session_ids = g.pop("written_sessions", ())
+
+    def generate():
+        yield sse_event({"delta": text})
+        commit_messages(session_ids)
+        yield sse_event({"done": True})
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_completion(session_id, user_id, messages, on_complete=None):
+    # Forward completion deltas to the browser as Server-Sent Events and
+    # persist the answer, or the part sent before the client went away.
+    # The call is made before the response starts, so quota errors still get a status code
+    start = time.perf_counter()
+    completion_stream = llm.chat(
+        completion_model_name, messages, priority=INTERACTIVE, stream=True,
+        **({"stream_options": {"include_usage": True}} if OPENAI_STREAM_USAGE else {})
+    )
+
+    def generate():
+        parts = []
+        usage = None
+        completed = False
+        try:
+            try:
+                for chunk in completion_stream:
+                    # The usage chunk, like Azure's content filter chunk, has no choices
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not parts:
+                            STAGE_SECONDS.observe(time.perf_counter() - start, stage="completion_first_token")
+                        parts.append(delta)
+                        yield sse_event({"delta": delta})
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage="completion")
+                completed = True
+            except Exception as e:
+                logging.error(f"Error while streaming completion: {e}")
+                yield sse_event({"error": "Failed to generate response"})
+        finally:
+            # Also reached through GeneratorExit when the client disconnects: stop the
+            # upstream generation and keep what the user has already seen
+            completion_stream.close()
+            assistant_response = "".join(parts)
+            try:
+                if usage is not None:
+                    record_usage(completion_model_name, usage)
+                else:
+                    OPENAI_TOKENS.inc(
+                        conversation_memory.count_tokens(assistant_response, completion_model_name),
+                        model=completion_model_name, type="completion_estimated"
+                    )
+                if assistant_response:
+                    save_message(session_id, user_id, assistant_response, "assistant")
+                if completed and on_complete:
+                    on_complete(assistant_response)
+                commit_messages(g.pop("written_sessions", ()))
+            except Exception as e:
+                logging.error(f"Error while saving streamed completion: {e}")
+        if completed:
+            yield sse_event({"done": True})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # A generator closed before its first step never runs its finally block
+    response.call_on_close(completion_stream.close)
+    return response
+
+@app.route("/cache_stats", methods=["GET"])
+@login_required
+def cache_stats():
+    return jsonify({
+        "status": "success",
+        "response_cache": response_cache.stats()
+    })
+
 @app.route("/new_conversation", methods=["POST"])
 @login_required
 def new_conversation():
@@ -391,59 +1100,171 @@ def new_conversation():
 @login_required
 def get_conversations():
     try:
-        # Get all unique session IDs with messages from this user
-        unique_sessions = db.session.query(ChatHistory.session_id).distinct().all()
-        conversations = []
-        
-        for session_id_tuple in unique_sessions:
-            session_id = session_id_tuple[0]
-            # Get first message from this session (usually user question)
-            first_message = ChatHistory.query.filter_by(
-                session_id=session_id, 
-                sender="user"
-            ).order_by(ChatHistory.timestamp).first()
-            
-            # If no user message is found, try to get any message
-            if not first_message:
-                first_message = ChatHistory.query.filter_by(
-                    session_id=session_id
-                ).order_by(ChatHistory.timestamp).first()
-            
-            # Get last message timestamp
-            last_message = ChatHistory.query.filter_by(
-                session_id=session_id
-            ).order_by(ChatHistory.timestamp.desc()).first()
-            
-            if first_message:
-                # Create a title from the first message - truncate to 50 chars
-                title = first_message.message
-                if len(title) > 50:
-                    title = title[:47] + "..."
-                
-                conversations.append({
-                    "id": session_id,
-                    "title": title,
-                    "timestamp": last_message.timestamp.isoformat() if last_message else "",
-                    "is_current": session_id == session.get("session_id", "")
-                })
-        
-        # Sort conversations by timestamp (newest first)
-        conversations.sort(key=lambda x: x["timestamp"], reverse=True)
-        
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+        cursor = request.args.get("cursor")
+
+        if cursor:
+            cursor_timestamp, _, cursor_session_id = cursor.partition("|")
+            cursor_timestamp = datetime.fromisoformat(cursor_timestamp)
+
+        # Keyset pagination over (last_timestamp, session_id), newest first, across
+        # live and archived conversations; each side is limited before the merge
+        pages = []
+        for model, archived in ((Conversation, False), (ArchivedConversation, True)):
+            query = db.select(
+                model.session_id, model.title, model.last_timestamp, db.literal(archived).label("archived")
+            ).where(model.user_id == current_user_id())
+            if cursor:
+                query = query.where(db.or_(
+                    model.last_timestamp < cursor_timestamp,
+                    db.and_(model.last_timestamp == cursor_timestamp, model.session_id < cursor_session_id)
+                ))
+            pages.append(query.order_by(model.last_timestamp.desc(), model.session_id.desc()).limit(limit + 1).subquery())
+        merged = db.union_all(*(db.select(page) for page in pages)).subquery()
+        page = db.session.execute(
+            db.select(merged).order_by(merged.c.last_timestamp.desc(), merged.c.session_id.desc()).limit(limit + 1)
+        ).all()
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        current_session_id = session.get("session_id", "")
+        conversations = [
+            {
+                "id": conversation.session_id,
+                "title": conversation.title,
+                "timestamp": conversation.last_timestamp.isoformat(),
+                "is_current": conversation.session_id == current_session_id,
+                "archived": bool(conversation.archived)
+            }
+            for conversation in page
+        ]
+        next_cursor = None
+        if has_more:
+            last = page[-1]
+            next_cursor = f"{last.last_timestamp.isoformat()}|{last.session_id}"
+
         return jsonify({
             "status": "success",
-            "conversations": conversations
+            "conversations": conversations,
+            "next_cursor": next_cursor
         })
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         logging.error(f"Error getting conversations: {e}")
         return jsonify({"error": "Failed to retrieve conversations"}), 500
 
+SEARCH_TERM = re.compile(r"\w+")
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+
+def search_terms(query):
+    return SEARCH_TERM.findall(query)[:10]
+
+def search_match_expression(terms, user_id):
+    # Quote every word so user input can never be parsed as FTS5 syntax; the last
+    # word matches as a prefix to support search-as-you-type
+    terms = [f'"{term}"' for term in terms]
+    terms[-1] += "*"
+    return f"owner : {user_id.encode('utf-8').hex().upper()} AND message : ({' '.join(terms)})"
+
+def search_tsquery(terms):
+    # Same semantics for PostgreSQL: every word required, the last one as a prefix
+    terms = [f"'{term}'" for term in terms]
+    terms[-1] += ":*"
+    return " & ".join(terms)
+
+def highlight_snippet(snippet):
+    # Escape the message text, then turn the FTS markers into <mark> tags
+    return html.escape(snippet).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+def search_messages(terms, user_id, limit, offset):
+    if search_backend == "tsvector":
+        # Rank the matches first, then build headlines for the returned page only
+        return db.session.execute(db.text("""
+            SELECT m.id, m.session_id, m.sender, m.timestamp, c.title,
+                   ts_headline('simple', m.message, to_tsquery('simple', :tsquery), :options) AS snippet
+            FROM (
+                SELECT h.id, h.session_id, h.sender, h.timestamp, h.message,
+                       ts_rank(h.message_tsv, to_tsquery('simple', :tsquery)) AS rank
+                FROM chat_history h
+                WHERE h.message_tsv @@ to_tsquery('simple', :tsquery) AND h.user_id = :user_id
+                ORDER BY rank DESC, h.id DESC
+                LIMIT :limit OFFSET :offset
+            ) m
+            LEFT JOIN conversation c ON c.session_id = m.session_id
+            ORDER BY m.rank DESC, m.id DESC
+        """), {
+            "tsquery": search_tsquery(terms), "user_id": user_id, "limit": limit, "offset": offset,
+            "options": f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=16, MinWords=5, "
+                       "MaxFragments=1, FragmentDelimiter=…"
+        }).all()
+
+    # The owner term in the MATCH narrows the index scan; the join on
+    # chat_history.user_id re-checks ownership. ORDER BY rank is served by FTS5,
+    # so snippets are only built for the returned page
+    table = migrations.SEARCH_TABLE
+    return db.session.execute(db.text(f"""
+        SELECT h.id, h.session_id, h.sender, h.timestamp, c.title,
+               snippet({table}, 0, :start, :end, '…', 16) AS snippet
+        FROM {table}
+        JOIN chat_history h ON h.id = {table}.rowid
+        LEFT JOIN conversation c ON c.session_id = h.session_id
+        WHERE {table} MATCH :expression AND h.user_id = :user_id
+        ORDER BY {table}.rank
+        LIMIT :limit OFFSET :offset
+    """), {
+        "start": SNIPPET_START, "end": SNIPPET_END, "expression": search_match_expression(terms, user_id),
+        "user_id": user_id, "limit": limit, "offset": offset
+    }).all()
+
+@app.route("/search_conversations", methods=["GET"])
+@login_required
+def search_conversations():
+    try:
+        if search_backend is None:
+            return jsonify({"error": "Search is not available"}), 503
+
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 50)
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        user_id = current_user_id()
+        terms = search_terms(request.args.get("q", ""))
+        if not terms or not user_id:
+            return jsonify({"status": "success", "results": [], "next_offset": None})
+
+        rows = search_messages(terms, user_id, limit + 1, offset)
+
+        has_more = len(rows) > limit
+        results = [
+            {
+                "message_id": row.id,
+                "conversation_id": row.session_id,
+                "title": row.title,
+                "sender": row.sender,
+                "timestamp": datetime.fromisoformat(str(row.timestamp)).isoformat(),
+                "snippet_html": highlight_snippet(row.snippet)
+            }
+            for row in rows[:limit]
+        ]
+        return jsonify({
+            "status": "success",
+            "results": results,
+            "next_offset": offset + limit if has_more else None
+        })
+    except Exception as e:
+        logging.error(f"Error searching conversations: {e}")
+        return jsonify({"error": "Failed to search conversations"}), 500
+
 @app.route("/switch_conversation/<session_id>", methods=["GET"])
 @login_required
 def switch_conversation(session_id):
     try:
-        # Check if the conversation exists
-        exists = db.session.query(ChatHistory.id).filter_by(session_id=session_id).first() is not None
+        # Check if the conversation exists and belongs to the current user;
+        # an archived one is moved back first
+        conversation = db.session.get(Conversation, session_id)
+        if conversation is None:
+            retention.restore(session_id, current_user_id())
+            conversation = db.session.get(Conversation, session_id)
+        exists = conversation is not None and conversation.user_id == current_user_id()
         
         if not exists:
             return jsonify({"error": "Conversation not found"}), 404
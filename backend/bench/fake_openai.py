@@ -0,0 +1,221 @@
+"""Local stand-in for the Azure OpenAI deployments used by the app.
+
+Serves ``/openai/deployments/<name>/chat/completions`` (plain and streamed)
+and ``/openai/deployments/<name>/embeddings`` with configurable latency,
+token rate and per-deployment RPM quota (answered with 429 and Retry-After
+like Azure), so the app can be benchmarked without network access or quota.
+
+    python -m bench.fake_openai --port 8089 --latency 0.3 --tokens-per-second 50
+"""
+import argparse
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("You", "have", "twenty", "vacation", "days", "left", "this", "year", "according", "to", "HR", "records.")
+ROUTE = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/(?P<operation>chat/completions|embeddings)")
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency=0.2, tokens_per_second=50.0, completion_tokens=40, embedding_dim=64, rpm=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        self.rpm = rpm
+        self.requests = 0
+        self.throttled = 0
+        self.recent = {}  # deployment -> deque of request times within the current window
+        self.lock = threading.Lock()
+
+    def admit(self, deployment):
+        """Return 0 if the request is within the deployment's quota, else seconds to wait.
+
+        Like Azure, the per-minute quota is enforced over 10 second windows.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            if not self.rpm:
+                return 0
+            recent = self.recent.setdefault(deployment, deque())
+            while recent and recent[0] <= now - 10:
+                recent.popleft()
+            if len(recent) >= max(1, self.rpm // 6):
+                self.throttled += 1
+                return recent[0] + 10 - now
+            recent.append(now)
+            return 0
+
+
+def fake_embedding(text, dim):
+    # Deterministic pseudo-random unit-ish vector derived from the text
+    values = []
+    seed = text.encode("utf-8")
+    while len(values) < dim:
+        seed = hashlib.sha256(seed).digest()
+        values += [v / 2**31 for v in struct.unpack("<8i", seed)]
+    return values[:dim]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        match = ROUTE.match(self.path)
+        if not match:
+            self._send_json({"error": {"message": "Not found"}}, 404)
+            return
+        retry_after = self.config.admit(match["deployment"])
+        if retry_after:
+            body = json.dumps({"error": {"code": "429", "message": "Rate limit is exceeded."}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", str(max(1, round(retry_after))))
+            self.send_header("retry-after-ms", str(int(retry_after * 1000)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if match["operation"] == "embeddings":
+            self._embeddings(body)
+        elif body.get("stream"):
+            self._stream_completion(body, match["deployment"])
+        else:
+            self._completion(body, match["deployment"])
+
+    def _prompt_tokens(self, body):
+        return sum(len(str(m.get("content", ""))) // 4 + 4 for m in body.get("messages", []))
+
+    def _embeddings(self, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        time.sleep(self.config.latency / 4)
+        self._send_json({
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, self.config.embedding_dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": sum(len(t) // 4 + 1 for t in inputs), "total_tokens": 0}
+        })
+
+    def _words(self):
+        return [WORDS[i % len(WORDS)] for i in range(self.config.completion_tokens)]
+
+    def _completion(self, body, deployment):
+        words = self._words()
+        time.sleep(self.config.latency + len(words) / self.config.tokens_per_second)
+        prompt_tokens = self._prompt_tokens(body)
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)
+            }
+        })
+
+    def _stream_completion(self, body, deployment):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        time.sleep(self.config.latency)
+        # Azure opens every stream with a content filter chunk without choices
+        send({"id": "", "object": "", "created": 0, "model": "", "choices": [], "prompt_filter_results": []})
+        words = self._words()
+        for i, word in enumerate(words):
+            send(chunk({"role": "assistant", "content": word + " "} if i == 0 else {"content": word + " "}))
+            time.sleep(1 / self.config.tokens_per_second)
+        send(chunk({}, "stop"))
+        if body.get("stream_options", {}).get("include_usage"):
+            prompt_tokens = self._prompt_tokens(body)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                     "total_tokens": prompt_tokens + len(words)}
+            send({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                  "model": deployment, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_openai(port=0, **config):
+    """Start the server on a daemon thread and return it; ``server.server_port`` is the bound port."""
+    handler = type("Handler", (FakeOpenAIHandler,), {"config": FakeOpenAIConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=40)
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute per deployment before 429s")
+    args = parser.parse_args()
+
+    server = start_fake_openai(
+        args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_dim=args.embedding_dim,
+        rpm=args.rpm
+    )
+    print(f"Fake Azure OpenAI listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
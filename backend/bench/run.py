@@ -0,0 +1,305 @@
+"""Load test the app offline against a fake Azure OpenAI server.
+
+Run from the backend folder:
+
+    python -m bench.run --employees 100000 --messages 1000000 --concurrency 32 --requests 2000
+
+The app is imported in-process with MSAL replaced by a stub identity
+provider, served by a threaded WSGI server, and driven by ``--concurrency``
+logged-in users. Each scenario reports latency percentiles, throughput,
+errors and the mean number of chat database queries per request, which is
+where N+1 query regressions show up first.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import msal
+import requests
+from werkzeug.serving import make_server
+
+from bench.fake_openai import start_fake_openai
+from bench.seed import QUESTIONS, bench_email, seed
+
+# Each scenario is a VirtualUser method named after the Flask endpoint it calls
+SCENARIOS = ("process_input", "get_conversations", "chatbot", "switch_conversation", "search_conversations")
+SEARCH_TERMS = ("vacation", "parental leave", "carry", "position", "join", "days tak")
+
+
+class StubConfidentialClientApplication:
+    """Stand-in for msal.ConfidentialClientApplication.
+
+    The authorization code is the email of the user to sign in, so the bench
+    client plays the identity provider by calling /getAToken itself.
+    """
+
+    def __init__(self, client_id, **kwargs):
+        self.client_id = client_id
+
+    def get_authorization_request_url(self, scopes, redirect_uri=None, state=None, **kwargs):
+        return f"https://login.bench.local/authorize?state={state}"
+
+    def acquire_token_by_authorization_code(self, code, scopes, redirect_uri=None, **kwargs):
+        return {
+            "access_token": "bench",
+            "id_token_claims": {"preferred_username": code, "name": code.split("@")[0]}
+        }
+
+    def acquire_token_silent(self, scopes, account=None, **kwargs):
+        return None
+
+    def get_accounts(self, username=None):
+        return []
+
+    def remove_account(self, account):
+        pass
+
+
+def load_app(instance_path, openai_url):
+    os.environ.update({
+        "INSTANCE_PATH": instance_path,
+        "CLIENT_ID": "bench",
+        "CLIENT_SECRET": "bench",
+        "FLASK_SECRET_KEY": "bench",
+        "OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_ENDPOINT": openai_url,
+        "AZURE_OPENAI_API_VERSION": "2024-10-21",
+        "OPENAI_COMPLETION_MODEL": "bench-completion",
+        "OPENAI_EMBEDDING_MODEL": "bench-embedding",
+        "HR_POLICY_DIR": os.path.join(instance_path, "policies"),
+    })
+    msal.ConfidentialClientApplication = StubConfidentialClientApplication
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as app_module
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Plain HTTP on localhost
+    app_module.app.config["SESSION_COOKIE_SECURE"] = False
+    return app_module.app
+
+
+def start_app_server(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server
+
+
+def login(base_url, email):
+    client = requests.Session()
+    response = client.get(f"{base_url}/login", allow_redirects=False)
+    state = parse_qs(urlparse(response.headers["Location"]).query)["state"][0]
+    response = client.get(f"{base_url}/getAToken", params={"code": email, "state": state})
+    response.raise_for_status()
+    return client
+
+
+class VirtualUser:
+    def __init__(self, base_url, email):
+        self.base_url = base_url
+        self.email = email
+        self.client = login(base_url, email)
+        self.conversation_ids = [
+            conversation["id"]
+            for conversation in self.client.get(
+                f"{base_url}/get_conversations", params={"limit": 100}
+            ).json().get("conversations", [])
+        ]
+        self.sent = 0
+
+    def process_input(self, stream, distinct_queries):
+        self.sent += 1
+        query = random.choice(QUESTIONS)
+        if distinct_queries:
+            query = f"{query} ({self.email} #{self.sent})"
+        started = time.perf_counter()
+        response = self.client.post(
+            f"{self.base_url}/process_input", json={"query": query, "stream": stream}, stream=True
+        )
+        first_byte = None
+        body = b""
+        for chunk in response.iter_content(chunk_size=None):
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - started
+            body += chunk
+        return response.ok and b"\"error\":" not in body, first_byte
+
+    def get_conversations(self, **kwargs):
+        response = self.client.get(f"{self.base_url}/get_conversations", params={"limit": 20})
+        return response.ok, None
+
+    def chatbot(self, **kwargs):
+        response = self.client.get(f"{self.base_url}/chatbot")
+        return response.ok, None
+
+    def search_conversations(self, **kwargs):
+        response = self.client.get(
+            f"{self.base_url}/search_conversations", params={"q": random.choice(SEARCH_TERMS), "limit": 20}
+        )
+        return response.ok, None
+
+    def switch_conversation(self, **kwargs):
+        if not self.conversation_ids:
+            return False, None
+        session_id = random.choice(self.conversation_ids)
+        response = self.client.get(f"{self.base_url}/switch_conversation/{session_id}")
+        return response.ok, None
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def db_query_totals(base_url):
+    """Sum and count of the db_queries_per_request histogram, by endpoint."""
+    text = requests.get(f"{base_url}/metrics").text
+    totals = {}
+    for kind, endpoint, value in re.findall(
+        r'^db_queries_per_request_(sum|count)\{endpoint="([^"]*)"\} (\S+)$', text, re.MULTILINE
+    ):
+        totals.setdefault(endpoint, {"sum": 0.0, "count": 0.0})[kind] = float(value)
+    return totals
+
+
+def run_scenario(name, users, base_url, requests_count, concurrency, **options):
+    pool = list(users)
+    pool_lock = threading.Lock()
+    latencies, first_bytes, errors = [], [], 0
+    results_lock = threading.Lock()
+
+    def task(_):
+        nonlocal errors
+        with pool_lock:
+            user = pool.pop()
+        try:
+            started = time.perf_counter()
+            try:
+                ok, first_byte = getattr(user, name)(**options)
+            except requests.RequestException:
+                ok, first_byte = False, None
+            elapsed = time.perf_counter() - started
+        finally:
+            with pool_lock:
+                pool.append(user)
+        with results_lock:
+            latencies.append(elapsed)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+            if not ok:
+                errors += 1
+
+    before = db_query_totals(base_url).get(name, {"sum": 0.0, "count": 0.0})
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, range(requests_count)))
+    duration = time.perf_counter() - started
+    after = db_query_totals(base_url).get(name, {"sum": 0.0, "count": 0.0})
+
+    counted = after["count"] - before["count"]
+    result = {
+        "scenario": name,
+        "requests": requests_count,
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": requests_count / duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "db_queries_per_request": (after["sum"] - before["sum"]) / counted if counted else None,
+    }
+    if name == "process_input" and options.get("stream"):
+        result.update({
+            "ttfb_p50_ms": percentile(first_bytes, 50) * 1000,
+            "ttfb_p95_ms": percentile(first_bytes, 95) * 1000,
+            "ttfb_p99_ms": percentile(first_bytes, 99) * 1000,
+        })
+    return result
+
+
+def print_result(result):
+    line = (
+        f"{result['scenario']:<20} {result['requests']:>6} req {result['errors']:>4} err "
+        f"{result['throughput_rps']:>8.1f} req/s  "
+        f"p50 {result['p50_ms']:>7.1f}ms  p95 {result['p95_ms']:>7.1f}ms  p99 {result['p99_ms']:>7.1f}ms"
+    )
+    if "ttfb_p50_ms" in result:
+        line += (
+            f"  ttfb p50 {result['ttfb_p50_ms']:.1f}ms p95 {result['ttfb_p95_ms']:.1f}ms"
+            f" p99 {result['ttfb_p99_ms']:.1f}ms"
+        )
+    if result["db_queries_per_request"] is not None:
+        line += f"  {result['db_queries_per_request']:.1f} queries/req"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instance", help="instance folder (default: a new temporary folder)")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in --instance")
+    parser.add_argument("--employees", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000, help="employees owning the seeded history")
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="stream /process_input answers and report time to first byte")
+    parser.add_argument("--distinct-queries", action=argparse.BooleanOptionalAction, default=True,
+                        help="make every question unique so the response cache never answers")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake OpenAI time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=40)
+    parser.add_argument("--fake-rpm", type=int, default=0, help="fake OpenAI quota per deployment (0: none)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    instance_path = os.path.abspath(args.instance or tempfile.mkdtemp(prefix="hr-bench-"))
+    if not args.skip_seed:
+        seed(instance_path, args.employees, args.messages, args.users, args.messages_per_conversation)
+
+    fake_openai = start_fake_openai(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        rpm=args.fake_rpm
+    )
+    started = time.perf_counter()
+    app = load_app(instance_path, f"http://127.0.0.1:{fake_openai.server_port}")
+    print(f"App started in {time.perf_counter() - started:.1f}s (instance: {instance_path})")
+    server = start_app_server(app)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    active_users = min(args.concurrency, args.users, args.employees)
+    users = [VirtualUser(base_url, bench_email(i)) for i in range(active_users)]
+
+    results = []
+    for name in args.scenarios:
+        result = run_scenario(
+            name, users, base_url, args.requests, args.concurrency,
+            stream=args.stream, distinct_queries=args.distinct_queries
+        )
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    config = fake_openai.RequestHandlerClass.config
+    print(f"Fake OpenAI served {config.requests} calls, {config.throttled} throttled")
+    server.shutdown()
+    fake_openai.shutdown()
+
+
+if __name__ == "__main__":
+    main()
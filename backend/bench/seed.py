@@ -0,0 +1,179 @@
+"""Fill an instance folder with synthetic employees and chat history.
+
+    python -m bench.seed --instance /tmp/bench --employees 100000 --messages 1000000
+
+Employees are ``user<i>@bench.local``, loaded through import_hr; the first
+``--users`` of them own the generated conversations. Messages are written
+with raw executemany in large transactions, so a million take seconds
+rather than minutes. The tables match the app's models; the app adds its
+indexes on startup.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from import_hr import import_employees
+
+POSITIONS = ("Développeur", "Designer", "Chef de Projet", "Comptable", "Commercial", "Technicien")
+QUESTIONS = (
+    "How many vacation days do I have left?",
+    "When did I join the company?",
+    "What is my current position?",
+    "Can I carry over unused vacation days to next year?",
+    "How do I request parental leave?",
+    "How many days have I taken this year?",
+)
+ANSWERS = (
+    "According to your HR record you have {} vacation days left out of {}.",
+    "You joined the company {} years ago; your contract allows {} days of paid leave.",
+    "Parental leave requests go through your manager; {} weeks are available, {} of them paid.",
+    "Unused days can be carried over until March, up to {} out of {}.",
+    "Your current position is listed in your record; contact HR to update it ({} of {} fields filled).",
+)
+BATCH_SIZE = 50_000
+
+
+def bench_email(i):
+    return f"user{i}@bench.local"
+
+
+def bench_session_id(user_index, n):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench/{user_index}/{n}"))
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    return conn
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_employees(path, count):
+    rng = random.Random(0)
+    records = (
+        {
+            "email": bench_email(i),
+            "full_name": f"Bench User {i}",
+            "position": rng.choice(POSITIONS),
+            "hire_date": (datetime(2010, 1, 1) + timedelta(days=rng.randrange(5000))).date().isoformat(),
+            "vacation_days": 25,
+            "days_taken": rng.randrange(26)
+        }
+        for i in range(count)
+    )
+    import_employees(path, records, prune=True)
+
+
+def seed_chat_history(path, messages, users, per_conversation):
+    conn = _connect(path)
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER NOT NULL PRIMARY KEY,
+        session_id VARCHAR(36) NOT NULL,
+        user_id VARCHAR(128),
+        message TEXT NOT NULL,
+        sender VARCHAR(10) NOT NULL,
+        timestamp DATETIME
+    );
+    CREATE TABLE IF NOT EXISTS conversation (
+        session_id VARCHAR(36) NOT NULL PRIMARY KEY,
+        user_id VARCHAR(128),
+        title VARCHAR(50) NOT NULL,
+        title_from_user BOOLEAN NOT NULL,
+        created_at DATETIME NOT NULL,
+        last_timestamp DATETIME NOT NULL,
+        summary TEXT,
+        summarized_until DATETIME
+    );
+    ''')
+    rng = random.Random(1)
+    start = datetime.utcnow() - timedelta(days=365)
+    conversations = []
+
+    def messages_rows():
+        written = 0
+        n = 0
+        while written < messages:
+            user_index = n % users
+            session_id = bench_session_id(user_index, n // users)
+            timestamp = start + timedelta(seconds=rng.randrange(365 * 86400))
+            count = min(per_conversation, messages - written)
+            first_question = None
+            for i in range(count):
+                if i % 2 == 0:
+                    text, sender = rng.choice(QUESTIONS), "user"
+                    first_question = first_question or text
+                else:
+                    text, sender = rng.choice(ANSWERS).format(rng.randrange(26), 25), "assistant"
+                yield session_id, bench_email(user_index), text, sender, timestamp.isoformat(" ")
+                timestamp += timedelta(seconds=rng.randrange(5, 120))
+            conversations.append((
+                session_id,
+                bench_email(user_index),
+                first_question or "New conversation",
+                first_question is not None,
+                (timestamp - timedelta(seconds=1)).isoformat(" "),
+                timestamp.isoformat(" ")
+            ))
+            written += count
+            n += 1
+
+    for batch in _batches(messages_rows()):
+        conn.executemany(
+            "INSERT INTO chat_history (session_id, user_id, message, sender, timestamp) VALUES (?, ?, ?, ?, ?)",
+            batch
+        )
+        conn.commit()
+    # created_at only needs to be plausible; the sidebar orders by last_timestamp
+    conn.executemany(
+        "INSERT OR REPLACE INTO conversation (session_id, user_id, title, title_from_user, created_at, last_timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        conversations
+    )
+    conn.commit()
+    conn.close()
+    return len(conversations)
+
+
+def seed(instance_path, employees, messages, users, per_conversation=20):
+    os.makedirs(instance_path, exist_ok=True)
+    users = min(users, employees)
+    started = time.perf_counter()
+    seed_employees(os.path.join(instance_path, "rh_database.db"), employees)
+    print(f"Seeded {employees} employees in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    conversations = seed_chat_history(
+        os.path.join(instance_path, "chat_history.db"), messages, users, per_conversation
+    )
+    print(f"Seeded {messages} messages in {conversations} conversations in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instance", required=True, help="instance folder to fill")
+    parser.add_argument("--employees", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000, help="employees owning the chat history")
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    args = parser.parse_args()
+    seed(args.instance, args.employees, args.messages, args.users, args.messages_per_conversation)
+
+
+if __name__ == "__main__":
+    main()
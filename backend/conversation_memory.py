@@ -0,0 +1,75 @@
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+# Tokens added by the chat format around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings = {}
+
+
+def count_tokens(text, model=None):
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except (KeyError, TypeError):
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = encoding
+    return len(encoding.encode(text))
+
+
+def message_tokens(message, model=None):
+    return count_tokens(message["message"], model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def split_turns(turns, budget, model=None, target_ratio=0.5):
+    """Split chronological ``turns`` into (turns to summarize, turns to keep).
+
+    Nothing is folded while the turns fit in ``budget`` tokens. Once they do
+    not, the oldest turns are folded until the kept ones fit in
+    ``budget * target_ratio``, so the summary is refreshed every few turns
+    instead of on every request. The latest turn is always kept.
+    """
+    sizes = [message_tokens(turn, model) for turn in turns]
+    total = sum(sizes)
+    if total <= budget:
+        return [], list(turns)
+
+    target = budget * target_ratio
+    cut = 0
+    while cut < len(turns) - 1 and total > target:
+        total -= sizes[cut]
+        cut += 1
+    return list(turns[:cut]), list(turns[cut:])
+
+
+def build_messages(system_prompt, summary, turns, user_content):
+    """Assemble the chat messages sent to the completion endpoint."""
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    messages += [
+        {"role": "assistant" if turn["sender"] == "assistant" else "user", "content": turn["message"]}
+        for turn in turns
+    ]
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+def summarize(previous_summary, turns, complete_fn):
+    """Fold ``turns`` into ``previous_summary`` with one completion call."""
+    transcript = "\n".join(f"{turn['sender']}: {turn['message']}" for turn in turns)
+    prompt = (
+        "Update the summary of an HR assistant conversation with the new turns below. "
+        "Keep facts, figures and open questions; drop greetings. Answer with the summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    summary = complete_fn([{"role": "user", "content": prompt}])
+    logging.info(f"Summarized {len(turns)} conversation turns")
+    return summary.strip()
@@ -0,0 +1,151 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """Two-tier cache of embedding vectors keyed by content hash and model.
+
+    The hot tier is an in-process LRU dictionary; the cold tier is an SQLite
+    table storing float32 vectors, evicted by least recent use once it holds
+    more than ``max_entries`` rows. Misses are embedded in batches of at most
+    ``max_batch_inputs`` texts and ``max_batch_tokens`` tokens (Azure rejects
+    larger requests), and each batch is stored as soon as it is embedded.
+
+    Caches with a different ``table`` share the database file but not their
+    rows or their ``max_entries`` budget, so one-off texts such as queries
+    cannot evict the embeddings of a corpus that is reused on every request.
+    """
+
+    # SQLite refuses statements with more than 32766 parameters
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, db_path, max_entries=100_000, hot_entries=2_048, max_batch_inputs=2048,
+                 max_batch_tokens=100_000, count_tokens=None, table="embeddings"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.table = table
+        self.max_entries = max_entries
+        self.hot_entries = hot_entries
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
+        self.count_tokens = count_tokens or (lambda text, model: len(text) // 4 + 1)
+        self.hits = 0
+        self.misses = 0
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            last_used REAL NOT NULL
+        )
+        '''.format(table=table))
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._hot[key] = vector
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def get_many(self, texts, model, embed_fn):
+        """Return one vector per text, calling ``embed_fn`` only for misses.
+
+        ``embed_fn`` receives batches of the texts that are not cached yet
+        and must return their vectors in the same order.
+        """
+        keys = [self.make_key(text, model) for text in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            cold_keys = []
+            for key in keys:
+                if key in self._hot:
+                    self._hot.move_to_end(key)
+                    found[key] = self._hot[key]
+                else:
+                    cold_keys.append(key)
+
+            rows = []
+            for start in range(0, len(cold_keys), self.LOOKUP_CHUNK):
+                chunk = cold_keys[start:start + self.LOOKUP_CHUNK]
+                placeholders = ",".join("?" for _ in chunk)
+                rows += self._conn.execute(
+                    f"SELECT key, vector FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+            if rows:
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                    self._remember(key, found[key])
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                    [(now, key) for key, _ in rows]
+                )
+                self._conn.commit()
+
+        # Embed each distinct missing text once, outside the lock
+        missing = OrderedDict()
+        for text, key in zip(texts, keys):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        for batch in self._batches(list(missing.items()), model):
+            vectors = embed_fn([text for _, text in batch])
+            with self._lock:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                    [
+                        (key, model, array("f", vector).tobytes(), now)
+                        for (key, _), vector in zip(batch, vectors)
+                    ]
+                )
+                for (key, _), vector in zip(batch, vectors):
+                    found[key] = list(vector)
+                    self._remember(key, found[key])
+                self._evict()
+                self._conn.commit()
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return [found[key] for key in keys]
+
+    def _batches(self, items, model):
+        batch = []
+        tokens = 0
+        for key, text in items:
+            size = self.count_tokens(text, model)
+            if batch and (len(batch) == self.max_batch_inputs or tokens + size > self.max_batch_tokens):
+                yield batch
+                batch = []
+                tokens = 0
+            batch.append((key, text))
+            tokens += size
+        if batch:
+            yield batch
+
+    def _evict(self):
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
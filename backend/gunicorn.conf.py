@@ -0,0 +1,39 @@
+# Gunicorn settings for the chatbot: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from metrics import mark_process_dead
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# gevent workers serve each request on a green thread, so a request waiting on
+# Azure OpenAI no longer pins an OS thread; one process handles as many
+# concurrent chats as worker_connections allows.
+worker_class = "gevent"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Streamed completions can stay open for the whole generation
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+
+certfile = os.getenv("SSL_CERTFILE")
+keyfile = os.getenv("SSL_KEYFILE")
+
+# Workers merge their metrics through this folder, so /metrics reports the
+# whole server whichever worker answers the scrape
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"hr-chatbot-metrics-{bind.rsplit(':', 1)[-1]}")
+)
+
+
+def on_starting(server):
+    # Totals start over with the server, as they would in a single process
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    mark_process_dead(metrics_dir, worker.pid)
@@ -0,0 +1,108 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# Columns that may reach the prompt, in rendering order, with their labels.
+# Anything else in the row (id, row_hash, future bookkeeping columns) is never sent.
+FIELDS = OrderedDict([
+    ("full_name", "name"),
+    ("email", "email"),
+    ("position", "position"),
+    ("hire_date", "hire_date"),
+    ("vacation_days", "vacation_days"),
+    ("days_taken", "days_taken"),
+    ("days_left", "days_left"),
+])
+ALWAYS = ("full_name",)
+
+
+def _keywords(*words):
+    """Case-insensitive pattern for whole ``words`` or their plural; a trailing ``*`` accepts any ending."""
+    alternatives = (re.escape(word[:-1]) + r"\w*" if word.endswith("*") else re.escape(word) + "s?" for word in words)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+# Question keywords (English and French) and the columns they need. Keywords are
+# anchored on word boundaries so that "today" does not ask for vacation days
+TOPICS = (
+    (_keywords("vacation", "holiday", "leave", "day", "off", "pto", "congé*", "conge*", "vacances", "jour",
+               "absence", "absent", "rtt", "solde"),
+     ("vacation_days", "days_taken", "days_left")),
+    (_keywords("hire", "hired", "hiring", "join", "joined", "start", "started", "seniority", "anniversary",
+               "embauch*", "arriv*", "anciennet*", "recrut*"),
+     ("hire_date",)),
+    (_keywords("position", "role", "job", "title", "team", "poste", "fonction", "métier", "metier", "équipe",
+               "equipe", "intitulé"),
+     ("position",)),
+    (_keywords("email", "e-mail", "mail", "contact", "adresse", "courriel"),
+     ("email",)),
+)
+
+
+def row_version(row):
+    """Content version of an employee row: its import hash, or a hash of its values."""
+    if row.get("row_hash"):
+        return row["row_hash"]
+    values = "\x1f".join(f"{column}={row.get(column)}" for column in FIELDS)
+    return hashlib.blake2b(values.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmployeeContext:
+    """Renders employee rows as compact ``key: value`` lines for the prompt.
+
+    Only the columns relevant to the question are rendered (all of them when
+    no topic matches). Rendered blocks are cached per employee version and
+    column selection, so an unchanged row is formatted once.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # (row version, columns) -> text
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def columns_for(query):
+        """Columns needed to answer ``query``, in rendering order."""
+        wanted = set(ALWAYS)
+        for pattern, columns in TOPICS:
+            if pattern.search(query or ""):
+                wanted.update(columns)
+        if wanted == set(ALWAYS):
+            return tuple(FIELDS)
+        return tuple(column for column in FIELDS if column in wanted)
+
+    @staticmethod
+    def _format(row, columns):
+        lines = []
+        for column in columns:
+            if column == "days_left":
+                if row.get("vacation_days") is None or row.get("days_taken") is None:
+                    continue
+                value = row["vacation_days"] - row["days_taken"]
+            else:
+                value = row.get(column)
+            if value is not None and value != "":
+                lines.append(f"{FIELDS[column]}: {value}")
+        return "\n".join(lines)
+
+    def render(self, row, columns=None):
+        """Return the text of ``row`` restricted to ``columns`` (default: all)."""
+        columns = tuple(columns or FIELDS)
+        key = (row_version(row), columns)
+        with self._lock:
+            text = self._cache.get(key)
+            if text is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+
+        text = self._format(row, columns)
+        with self._lock:
+            self._cache[key] = text
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return text
@@ -0,0 +1,197 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+
+class _HRConnection(sqlite3.Connection):
+    # Last PRAGMA data_version seen on this connection
+    data_version = None
+
+
+class _EmployeeCache:
+    """Employee rows by email, expiring after ``ttl`` seconds, least recently used evicted first."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # email -> (expires_at, rows)
+        self._lock = threading.Lock()
+
+    def get(self, email, now):
+        with self._lock:
+            cached = self._entries.get(email)
+            if cached is None:
+                return None
+            if cached[0] <= now:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return cached[1]
+
+    def put(self, email, rows, now):
+        with self._lock:
+            self._entries[email] = (now + self.ttl, rows)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email=None):
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(email, None)
+
+
+class HRStore:
+    """Read-only access layer for rh_database.db.
+
+    Connections are opened read-only, kept in a pool of at most ``pool_size``
+    and reused across requests (a pool rather than thread-locals, so green
+    threads share connections too). Up to ``cache_max_entries`` employee
+    records are cached by email for ``cache_ttl`` seconds, and the cache is
+    dropped as soon as SQLite reports that another connection (e.g.
+    import_hr.py) committed to the database.
+    """
+
+    EMPLOYEE_QUERY = "SELECT * FROM employees WHERE email = ?"
+
+    def __init__(self, db_path, cache_ttl=300, pool_size=8, cache_max_entries=10_000):
+        self.db_path = db_path
+        self.cache_ttl = cache_ttl
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._cache = _EmployeeCache(cache_ttl, cache_max_entries)
+        # data_version values only compare within one connection, so one
+        # connection outside the pool tells new connections what they missed
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=64,
+            factory=_HRConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        return conn
+
+    def _open(self):
+        conn = self._connect()
+        # Opening a connection beyond the pool size is routine under load, so
+        # only a commit since the last check drops the cache
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = self._connect()
+            version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+            changed = self._data_version is not None and version != self._data_version
+            self._data_version = version
+        if changed:
+            logging.info("rh_database.db changed on disk, clearing employee cache")
+            self.invalidate()
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _check_data_version(self, conn):
+        # data_version changes whenever another connection commits to the file
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != conn.data_version:
+            conn.data_version = version
+            logging.info("rh_database.db changed on disk, clearing employee cache")
+            self.invalidate()
+
+    def invalidate(self, email=None):
+        self._cache.invalidate(email)
+
+    def get_employee_rows(self, email):
+        """Return the employee rows matching ``email`` as a list of dicts."""
+        with self._connection() as conn:
+            self._check_data_version(conn)
+
+            now = time.monotonic()
+            rows = self._cache.get(email, now)
+            if rows is not None:
+                self.hits += 1
+                return rows
+            self.misses += 1
+
+            rows = [dict(row) for row in conn.execute(self.EMPLOYEE_QUERY, (email,))]
+        self._cache.put(email, rows, now)
+        return rows
+
+    def close(self):
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SQLAlchemyHRStore:
+    """Same interface as ``HRStore`` for an employees table on a database server.
+
+    Used when the HR data lives in a shared database (HR_DATABASE_URL) rather
+    than a file next to each node. Connections come from the engine's pool;
+    there is no cheap change counter to poll, so cached records only expire
+    after ``cache_ttl`` seconds.
+    """
+
+    EMPLOYEE_QUERY = sa.text("SELECT * FROM employees WHERE email = :email")
+
+    def __init__(self, url, cache_ttl=300, engine_options=None, cache_max_entries=10_000):
+        self.engine = sa.create_engine(url, **(engine_options or {}))
+        # Shown in logs, so never with the password
+        self.db_path = self.engine.url.render_as_string(hide_password=True)
+        self.cache_ttl = cache_ttl
+        self._cache = _EmployeeCache(cache_ttl, cache_max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, email=None):
+        self._cache.invalidate(email)
+
+    def get_employee_rows(self, email):
+        """Return the employee rows matching ``email`` as a list of dicts."""
+        now = time.monotonic()
+        rows = self._cache.get(email, now)
+        if rows is not None:
+            self.hits += 1
+            return rows
+        self.misses += 1
+
+        with self.engine.connect() as conn:
+            rows = [dict(row) for row in conn.execute(self.EMPLOYEE_QUERY, {"email": email}).mappings()]
+        self._cache.put(email, rows, now)
+        return rows
+
+    def close(self):
+        self.engine.dispose()
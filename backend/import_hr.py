@@ -0,0 +1,220 @@
+"""Load an HR extract into rh_database.db.
+
+    python import_hr.py employees.csv
+    python import_hr.py extract.jsonl --prune
+
+The input (CSV with a header row, or JSON Lines; ``-`` reads stdin)
+is streamed into a staging table in large ``executemany`` batches, then
+merged into ``employees`` in a single transaction. Each row carries a hash
+of its content, so rows that did not change are not rewritten. Secondary
+indexes are dropped before the merge and rebuilt once at the end.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+COLUMNS = ("email", "full_name", "position", "hire_date", "vacation_days", "days_taken")
+REQUIRED = object()
+# (column, default, converter) in COLUMNS order
+FIELDS = (
+    ("email", REQUIRED, str),
+    ("full_name", REQUIRED, str),
+    ("position", None, str),
+    ("hire_date", None, str),
+    ("vacation_days", 25, int),
+    ("days_taken", 0, int),
+)
+
+
+def default_db_path():
+    instance_path = os.getenv("INSTANCE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+    return os.path.join(instance_path, "rh_database.db")
+
+
+def _read(f, fmt):
+    if fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(f)
+
+
+def read_records(path, fmt):
+    if path == "-":
+        yield from _read(sys.stdin, fmt)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from _read(f, fmt)
+
+
+def normalize(record):
+    """Return the row tuple for ``record`` (without hash), or raise ValueError."""
+    values = []
+    for column, default, convert in FIELDS:
+        value = record.get(column)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            if default is REQUIRED:
+                raise ValueError(f"missing {column}")
+            values.append(default)
+        else:
+            values.append(convert(value))
+    return tuple(values)
+
+
+def row_hash(values):
+    return hashlib.blake2b("\x1f".join(map(str, values)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def staged_rows(records, counters):
+    for line, record in enumerate(records, start=1):
+        counters["read"] += 1
+        try:
+            values = normalize(record)
+        except (ValueError, TypeError) as e:
+            counters["skipped"] += 1
+            logging.warning(f"Skipping record {line}: {e}")
+            continue
+        yield values + (row_hash(values),)
+
+
+def connect(db_path, cache_mb):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # WAL keeps the app reading the previous snapshot while the merge runs
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def ensure_schema(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        full_name TEXT NOT NULL,
+        position TEXT,
+        hire_date TEXT,
+        vacation_days INTEGER DEFAULT 25,
+        days_taken INTEGER DEFAULT 0,
+        row_hash TEXT
+    )
+    ''')
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(employees)")}
+    if "row_hash" not in existing:
+        conn.execute("ALTER TABLE employees ADD COLUMN row_hash TEXT")
+
+
+def import_employees(db_path, records, batch_size=50_000, prune=False, cache_mb=256):
+    """Merge ``records`` (dicts keyed by column name) into the employees table.
+
+    With ``prune``, employees missing from ``records`` are deleted, unless
+    some records were skipped as invalid. Returns a dict of counters: read,
+    skipped, duplicates (records superseded by a later one with the same
+    email), inserted, updated, unchanged, deleted and seconds.
+    """
+    started = time.perf_counter()
+    counters = dict.fromkeys(("read", "skipped", "duplicates", "inserted", "updated", "unchanged", "deleted"), 0)
+    conn = connect(db_path, cache_mb)
+    try:
+        ensure_schema(conn)
+
+        # Stage without any index, so the load is a plain append
+        columns = ", ".join(COLUMNS)
+        conn.execute(f"CREATE TEMP TABLE staging ({columns}, row_hash)")
+        placeholders = ", ".join("?" for _ in range(len(COLUMNS) + 1))
+        rows = staged_rows(records, counters)
+        conn.execute("BEGIN")
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            conn.executemany(f"INSERT INTO staging VALUES ({placeholders})", batch)
+        conn.execute("CREATE INDEX temp.staging_email ON staging (email)")
+        conn.execute("COMMIT")
+        staged = counters["read"] - counters["skipped"]
+        counters["duplicates"] = staged - conn.execute("SELECT COUNT(DISTINCT email) FROM staging").fetchone()[0]
+
+        conn.execute("BEGIN IMMEDIATE")
+        indexes = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'employees' AND sql IS NOT NULL"
+        ).fetchall()
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX "{name}"')
+
+        before = conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0]
+        # The last occurrence of a duplicated email wins
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:] + ("row_hash",))
+        changed = conn.execute(f'''
+        INSERT INTO employees ({columns}, row_hash)
+        SELECT {columns}, row_hash FROM staging
+        WHERE rowid IN (SELECT MAX(rowid) FROM staging GROUP BY email)
+        ON CONFLICT (email) DO UPDATE SET {updates}
+        WHERE employees.row_hash IS NOT excluded.row_hash
+        ''').rowcount
+        counters["inserted"] = conn.execute("SELECT COUNT(*) FROM employees").fetchone()[0] - before
+        counters["updated"] = changed - counters["inserted"]
+        counters["unchanged"] = staged - counters["duplicates"] - changed
+
+        # A skipped record may be an employee who is still there, so never prune
+        # on an input that did not fully load
+        if prune and counters["skipped"]:
+            logging.error(f"Not pruning employees: {counters['skipped']} records were skipped")
+        elif prune:
+            counters["deleted"] = conn.execute(
+                "DELETE FROM employees WHERE NOT EXISTS (SELECT 1 FROM staging WHERE staging.email = employees.email)"
+            ).rowcount
+
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+        conn.execute("PRAGMA optimize")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    counters["seconds"] = time.perf_counter() - started
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSON Lines file, or - for stdin")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--db", default=default_db_path(), help="default: instance/rh_database.db")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--cache-mb", type=int, default=256, help="SQLite page cache for the import")
+    parser.add_argument("--prune", action="store_true", help="delete employees missing from the input, unless records were skipped")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv")
+    counters = import_employees(
+        args.db, read_records(args.input, fmt),
+        batch_size=args.batch_size, prune=args.prune, cache_mb=args.cache_mb
+    )
+    logging.info(
+        f"Imported {counters['read']} records into {args.db} in {counters['seconds']:.2f}s "
+        f"({counters['read'] / max(counters['seconds'], 1e-9):,.0f} rows/s): "
+        f"{counters['inserted']} inserted, {counters['updated']} updated, {counters['unchanged']} unchanged, "
+        f"{counters['deleted']} deleted, {counters['skipped']} skipped, {counters['duplicates']} duplicates"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import openai
+
+# Lower values are served first when a deployment is at its quota
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+
+
+class LLMUnavailableError(Exception):
+    """Azure OpenAI could not serve the call in time.
+
+    ``status`` is 429 when the deployment quota is exhausted and 503 when the
+    service kept failing; ``retry_after`` is a hint in seconds for the client.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        # Azure enforces per-minute quotas over 10 second windows, so bursts are
+        # capped at a sixth of the quota
+        self.capacity = max(1, per_minute / 6)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # A call larger than the bucket may start once the bucket is full
+        needed = min(amount, self.capacity)
+        return 0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        # Usage reported after the call may be below or above the estimate
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """Request and token buckets for one deployment, with a priority waiting room.
+
+    Callers wait in (priority, arrival) order; only the head of the queue
+    takes capacity, so bulk work cannot starve interactive requests. A 429
+    from the service blocks every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, rpm=0, tpm=0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _wait_time(self, tokens, now):
+        return max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now) if self.requests else 0,
+            self.tokens.wait_time(tokens, now) if self.tokens else 0
+        )
+
+    def acquire(self, tokens, priority, deadline):
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] == entry:
+                        wait = self._wait_time(tokens, now)
+                        if wait <= 0:
+                            if self.requests:
+                                self.requests.take(1)
+                            if self.tokens:
+                                self.tokens.take(tokens)
+                            return
+                        if now + wait > deadline:
+                            raise LLMUnavailableError("Rate limit reached", 429, wait)
+                        self._cond.wait(wait)
+                    else:
+                        if now >= deadline:
+                            raise LLMUnavailableError("Rate limit reached", 429, self._wait_time(tokens, now))
+                        self._cond.wait(deadline - now)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def settle(self, estimated, actual):
+        if self.tokens and actual is not None:
+            with self._cond:
+                self.tokens.take(actual - estimated)
+
+    def block(self, seconds):
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            return float(response.headers[header]) / scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+class LLMDispatcher:
+    """Single entry point for Azure OpenAI calls.
+
+    - identical non-streaming calls in flight at the same time share one
+      upstream request;
+    - each deployment is metered by a ``RateLimiter`` built from its RPM/TPM
+      quota (``limits`` maps deployment name to ``(rpm, tpm)``; 0 disables);
+    - 429s and transient failures are retried with jittered exponential
+      backoff, honouring Retry-After, for at most ``max_wait`` seconds in
+      total, after which ``LLMUnavailableError`` is raised.
+
+    The OpenAI client must be created with ``max_retries=0`` so that retries
+    happen here, where they are rate-limited.
+    """
+
+    def __init__(self, client, limits=None, max_retries=4, max_wait=30.0, base_delay=0.5, max_delay=8.0,
+                 expected_completion_tokens=500, count_tokens=None):
+        self.client = client
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expected_completion_tokens = expected_completion_tokens
+        self.count_tokens = count_tokens or (lambda text, model: len(text) // 4 + 1)
+        self.limiters = {model: RateLimiter(rpm, tpm) for model, (rpm, tpm) in (limits or {}).items()}
+        self.coalesced = 0
+        self.retries = 0
+        self.rejected = 0
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _limiter(self, model):
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            limiter = self.limiters.setdefault(model, RateLimiter())
+        return limiter
+
+    def _coalesce(self, key, call):
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = call()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _dispatch(self, model, estimated_tokens, priority, call):
+        limiter = self._limiter(model)
+        deadline = time.monotonic() + self.max_wait
+        for attempt in itertools.count():
+            try:
+                limiter.acquire(estimated_tokens, priority, deadline)
+            except LLMUnavailableError:
+                self.rejected += 1
+                raise
+            try:
+                return call()
+            except openai.RateLimitError as e:
+                delay = retry_after_seconds(e) or self._backoff(attempt)
+                # Everyone waits for the quota window, not only this caller
+                limiter.block(delay)
+                status, error = 429, e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                delay = self._backoff(attempt)
+                status, error = 503, e
+
+            if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                self.rejected += 1
+                raise LLMUnavailableError(f"Azure OpenAI unavailable: {error}", status, delay) from error
+            self.retries += 1
+            logging.warning(f"Azure OpenAI call to {model} failed ({error}), retrying in {delay:.2f}s")
+            if status != 429:
+                time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # Full jitter: concurrent callers spread out instead of retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def chat(self, model, messages, priority=INTERACTIVE, stream=False, **kwargs):
+        """chat.completions.create through the limiter; streams are never shared."""
+        estimated = sum(self.count_tokens(str(m.get("content", "")), model) + 4 for m in messages) \
+            + kwargs.get("max_tokens", self.expected_completion_tokens)
+
+        def call():
+            completion = self._dispatch(model, estimated, priority, lambda: self.client.chat.completions.create(
+                model=model, messages=messages, stream=stream, **kwargs
+            ))
+            if not stream:
+                usage = getattr(completion, "usage", None)
+                self._limiter(model).settle(estimated, usage.total_tokens if usage else None)
+            return completion
+
+        if stream:
+            return call()
+        return self._coalesce(self._key("chat", model, messages, kwargs), call)
+
+    def embed(self, model, texts, priority=INTERACTIVE):
+        """embeddings.create through the limiter."""
+        estimated = sum(self.count_tokens(text, model) for text in texts)
+
+        def call():
+            response = self._dispatch(model, estimated, priority, lambda: self.client.embeddings.create(
+                input=texts, model=model
+            ))
+            usage = getattr(response, "usage", None)
+            self._limiter(model).settle(estimated, usage.prompt_tokens if usage else None)
+            return response
+
+        return self._coalesce(self._key("embed", model, texts), call)
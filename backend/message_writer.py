@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+
+
+class MessageWriter:
+    """Write-behind buffer for chat messages.
+
+    ``enqueue`` only appends to an in-memory buffer; a single background
+    thread hands the buffer to ``persist_batch`` in batches of at most
+    ``batch_size`` messages, at least every ``flush_interval`` seconds.
+    Messages are persisted in the order they were enqueued and stay visible
+    through ``pending_for`` until their batch is committed. The buffer is per
+    process: ``flush_session`` lets a request wait for its own messages so
+    that other workers see them once its response is complete.
+
+    A failed batch is retried with exponential backoff capped at
+    ``max_retry_delay``, for as long as the database stays unreachable. Only
+    errors that ``is_permanent`` accepts (bad data rather than an outage) give
+    up after ``max_attempts``: the batch is then written one message at a
+    time and the messages that still fail that way are logged and dropped.
+    At most ``max_pending`` messages are buffered; beyond that ``enqueue``
+    raises, so callers can report the failure instead of losing the message.
+    """
+
+    def __init__(self, persist_batch, batch_size=100, flush_interval=0.5, retry_delay=1.0, max_attempts=5,
+                 max_retry_delay=30.0, max_pending=10_000, is_permanent=None):
+        self.persist_batch = persist_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.max_retry_delay = max_retry_delay
+        self.max_pending = max_pending
+        self.is_permanent = is_permanent or (lambda error: False)
+        self.dropped = 0
+        self._pending = []
+        self._handled = 0  # messages persisted or dropped so far, in enqueue order
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._flush_requested = False
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, message):
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Message writer is stopped")
+            if len(self._pending) >= self.max_pending:
+                raise RuntimeError(f"Message buffer is full ({self.max_pending} unsaved messages)")
+            self._pending.append(message)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def pending_for(self, session_id):
+        with self._condition:
+            return [message for message in self._pending if message["session_id"] == session_id]
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while not (self._stopping or self._flush_requested) and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._pending:
+                    self._flush_requested = False
+                    if self._stopping:
+                        return
+                    continue
+                batch = self._pending[:self.batch_size]
+
+            try:
+                self.persist_batch(batch)
+                failures = 0
+                done = len(batch)
+            except Exception as e:
+                failures += 1
+                done = 0
+                if failures >= self.max_attempts and self.is_permanent(e):
+                    logging.error(f"Failed to persist {len(batch)} messages {failures} times, writing them one by one: {e}")
+                    done = self._persist_one_by_one(batch)
+                    if done == len(batch):
+                        failures = 0
+                if done < len(batch):
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** (failures - 1))
+                    logging.error(f"Failed to persist {len(batch) - done} messages, retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+
+            # Only drop messages once they are committed so readers never miss them
+            if done:
+                with self._condition:
+                    del self._pending[:done]
+                    self._handled += done
+                    self._condition.notify_all()
+
+    def _persist_one_by_one(self, batch):
+        """Write ``batch`` in order, dropping bad messages; returns how many were handled.
+
+        Stops at the first message that fails for a reason worth retrying.
+        """
+        for done, message in enumerate(batch):
+            try:
+                self.persist_batch([message])
+            except Exception as e:
+                if not self.is_permanent(e):
+                    return done
+                self.dropped += 1
+                logging.error(
+                    f"Dropping {message['sender']} message of session {message['session_id']} "
+                    f"that cannot be persisted: {e}"
+                )
+        return len(batch)
+
+    def flush(self, timeout=None):
+        """Block until every message enqueued so far has been persisted."""
+        with self._condition:
+            return self._wait_until(self._handled + len(self._pending), timeout)
+
+    def flush_session(self, session_id, timeout=None):
+        """Block until the messages of ``session_id`` enqueued so far have been persisted.
+
+        Messages are written in order, so this also commits the older messages
+        of other sessions, in the same batch when the writer is keeping up.
+        """
+        with self._condition:
+            last = max(
+                (i for i, message in enumerate(self._pending) if message["session_id"] == session_id), default=None
+            )
+            if last is None:
+                return True
+            return self._wait_until(self._handled + last + 1, timeout)
+
+    def _wait_until(self, handled, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._flush_requested = True
+        self._condition.notify_all()
+        while self._handled < handled and self._thread.is_alive():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._condition.wait(remaining)
+        return self._handled >= handled
+
+    def stop(self, timeout=10):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._pending:
+            logging.error(f"Message writer stopped with {len(self._pending)} unsaved messages")
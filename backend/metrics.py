@@ -0,0 +1,251 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    type = "counter"
+    buckets = ()
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(key, list(series)) for key, series in self._series.items()]
+
+
+class Gauge:
+    """Gauge whose samples are computed by ``collect`` at scrape time.
+
+    ``collect`` returns a list of ``(label values, value)`` pairs.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.buckets = ()
+
+    def samples(self):
+        return [(tuple(key), value) for key, value in self.collect()]
+
+
+class CallbackCounter(Gauge):
+    """Counter read from a running total kept elsewhere, e.g. a cache's hit count."""
+
+    type = "counter"
+
+
+def _render(name, metric):
+    lines = [f"# HELP {name} {metric['documentation']}", f"# TYPE {name} {metric['type']}"]
+    labelnames = metric["labelnames"]
+    for key, value in sorted(metric["samples"].items()):
+        if metric["type"] != "histogram":
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+            continue
+        cumulative = 0
+        for bound, count in zip(metric["buckets"], value):
+            cumulative += count
+            labels = _format_labels(labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', '+Inf')])} {value[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(value[-2])}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {value[-1]}")
+    return lines
+
+
+def mark_process_dead(multiprocess_dir, pid):
+    """Drop the gauges of a worker that exited; its counters still count towards the totals."""
+    path = os.path.join(multiprocess_dir, f"{pid}.json")
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshot["metrics"] = {
+        name: metric for name, metric in snapshot["metrics"].items() if metric["type"] != "gauge"
+    }
+    _write_json(path, snapshot)
+
+
+def _write_json(path, data):
+    # Readers never see a half-written file
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text exposition format.
+
+    Without ``multiprocess_dir`` the values are those of this process. With
+    several worker processes, point every worker at the same empty folder
+    (PROMETHEUS_MULTIPROC_DIR, as with prometheus_client): each worker writes
+    a snapshot there every ``write_interval`` seconds and a scrape merges all
+    of them. Counters and histograms are summed over every worker that ever
+    ran, so they never go back when one is replaced; gauges are reported per
+    live worker with a ``pid`` label. Other workers' values are at most
+    ``write_interval`` seconds old.
+    """
+
+    def __init__(self, multiprocess_dir=None, write_interval=5.0):
+        self._metrics = []
+        self.multiprocess_dir = multiprocess_dir
+        self.write_interval = write_interval
+        self._writer = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def callback_counter(self, name, documentation, collect, labelnames=()):
+        return self.register(CallbackCounter(name, documentation, collect, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self.register(Gauge(name, documentation, collect, labelnames))
+
+    def _snapshot(self):
+        return {
+            metric.name: {
+                "type": metric.type,
+                "documentation": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(metric.buckets),
+                "samples": [[list(key), value] for key, value in metric.samples()],
+            }
+            for metric in self._metrics
+        }
+
+    def write(self):
+        """Write this process's snapshot to ``multiprocess_dir``."""
+        pid = os.getpid()
+        _write_json(os.path.join(self.multiprocess_dir, f"{pid}.json"), {"pid": pid, "metrics": self._snapshot()})
+
+    def start_writer(self):
+        if self._writer is not None:
+            return
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+
+        def loop():
+            while True:
+                try:
+                    self.write()
+                except Exception as e:
+                    logging.error(f"Failed to write metrics snapshot: {e}")
+                time.sleep(self.write_interval)
+
+        self._writer = threading.Thread(target=loop, name="metrics-writer", daemon=True)
+        self._writer.start()
+
+    def _merged(self):
+        if not self.multiprocess_dir:
+            return [{"pid": None, "metrics": self._snapshot()}]
+        self.write()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.multiprocess_dir, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+        return snapshots
+
+    def render(self):
+        merged = {}
+        for snapshot in self._merged():
+            for name, metric in snapshot["metrics"].items():
+                per_process = metric["type"] == "gauge" and snapshot["pid"] is not None
+                target = merged.setdefault(name, dict(
+                    metric, samples={},
+                    labelnames=metric["labelnames"] + (["pid"] if per_process else [])
+                ))
+                for key, value in metric["samples"]:
+                    key = tuple(key) + ((str(snapshot["pid"]),) if per_process else ())
+                    if key not in target["samples"]:
+                        target["samples"][key] = value
+                    elif metric["type"] == "histogram":
+                        target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+                    else:
+                        target["samples"][key] += value
+        lines = []
+        # Registration order, as in a single process
+        for metric in self._metrics:
+            if metric.name in merged:
+                lines += _render(metric.name, merged[metric.name])
+        return "\n".join(lines) + "\n"
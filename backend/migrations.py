@@ -0,0 +1,348 @@
+"""Versioned schema migrations for the chat database.
+
+Applied versions are recorded in ``schema_version``; each migration runs in
+its own transaction. The app applies pending migrations on startup unless
+AUTO_MIGRATE=false, in which case run them before deploying:
+
+    python migrations.py
+
+History written before conversations had owners stays hidden until it is
+given to a user, with LEGACY_CHAT_OWNER on the first migration or later with
+the user's Entra object id (the ``oid`` claim, what the app stores as owner):
+
+    python migrations.py --legacy-owner 3f2b9c4e-8a1d-4e6f-9b7a-0c5d2e1f4a38
+
+History given to the wrong user moves to another one with:
+
+    python migrations.py --reassign-owner OLD_OID NEW_OID
+
+Every migration must work on both SQLite and PostgreSQL, branching on
+``conn.dialect.name`` where the SQL differs.
+"""
+import argparse
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import sqlalchemy as sa
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from models import ArchivedConversation, ChatHistory, Conversation, conversation_title, database_url, db, engine_options
+from session_store import SQLAlchemySessionBackend
+
+SEARCH_TABLE = "chat_history_fts"
+# Arbitrary key of the PostgreSQL advisory lock serializing nodes that start together
+MIGRATION_LOCK_ID = 4_204_201
+
+schema_version = sa.Table(
+    "schema_version", sa.MetaData(),
+    sa.Column("version", sa.Integer, primary_key=True),
+    sa.Column("description", sa.String(200), nullable=False),
+    sa.Column("applied_at", sa.DateTime, nullable=False),
+)
+
+
+def baseline(conn):
+    # Also upgrades databases created before migrations existed
+    db.metadata.create_all(conn, tables=[ChatHistory.__table__, Conversation.__table__])
+    added_columns = {
+        ChatHistory.__table__: ["user_id"],
+        Conversation.__table__: ["user_id", "summary", "summarized_until"],
+    }
+    inspector = sa.inspect(conn)
+    for table, columns in added_columns.items():
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for name in columns:
+            if name not in existing:
+                column_type = table.c[name].type.compile(conn.dialect)
+                conn.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+                logging.info(f"Added {name} column to {table.name}")
+    conn.execute(sa.text("DROP INDEX IF EXISTS ix_conversation_last_timestamp"))
+    # create_all skips indexes of tables that already exist
+    for index in ChatHistory.__table__.indexes | Conversation.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def backfill_conversations(conn):
+    # Build the summary table from existing history in one aggregated query
+    if conn.execute(sa.select(Conversation.session_id).limit(1)).first() is not None:
+        return
+    partition = ChatHistory.session_id
+    ranked = sa.select(
+        ChatHistory.session_id,
+        ChatHistory.user_id,
+        ChatHistory.message,
+        ChatHistory.sender,
+        sa.func.row_number().over(
+            partition_by=partition,
+            order_by=(sa.case((ChatHistory.sender == "user", 0), else_=1), ChatHistory.timestamp, ChatHistory.id)
+        ).label("rn"),
+        sa.func.min(ChatHistory.timestamp).over(partition_by=partition).label("created_at"),
+        sa.func.max(ChatHistory.timestamp).over(partition_by=partition).label("last_timestamp")
+    ).subquery()
+    rows = conn.execute(sa.select(ranked).where(ranked.c.rn == 1)).all()
+    if rows:
+        conn.execute(sa.insert(Conversation.__table__), [
+            {
+                "session_id": row.session_id,
+                "user_id": row.user_id,
+                "title": conversation_title(row.message),
+                "title_from_user": row.sender == "user",
+                "created_at": row.created_at,
+                "last_timestamp": row.last_timestamp
+            }
+            for row in rows
+        ])
+        logging.info(f"Backfilled {len(rows)} conversations from chat history")
+
+
+def search_index(conn):
+    if conn.dialect.name == "postgresql":
+        # A generated tsvector column with a GIN index; 'simple' keeps words as typed
+        conn.execute(sa.text(
+            "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS message_tsv tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', message)) STORED"
+        ))
+        conn.execute(sa.text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_history_message_tsv ON chat_history USING GIN (message_tsv)"
+        ))
+        return
+    if conn.dialect.name != "sqlite":
+        logging.warning(f"Full-text search is not supported on {conn.dialect.name}")
+        return
+
+    # External-content FTS5 table kept in sync by triggers. The owner is indexed as
+    # one token (hex of user_id), so a search only walks the user's own doclist
+    if SEARCH_TABLE in sa.inspect(conn).get_table_names():
+        return  # built by the app before migrations existed
+    try:
+        with conn.begin_nested():
+            conn.execute(sa.text(
+                f"CREATE VIEW IF NOT EXISTS {SEARCH_TABLE}_source AS "
+                "SELECT id, message, hex(user_id) AS owner FROM chat_history"
+            ))
+            conn.execute(sa.text(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                f"message, owner, content='{SEARCH_TABLE}_source', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+    except sa.exc.OperationalError as e:
+        logging.warning(f"Full-text search disabled, FTS5 is not available: {e}")
+        return
+    for statement in (
+        f"""CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON chat_history BEGIN
+            INSERT INTO {SEARCH_TABLE} (rowid, message, owner) VALUES (new.id, new.message, hex(new.user_id));
+        END""",
+        f"""CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON chat_history BEGIN
+            INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, message, owner)
+            VALUES ('delete', old.id, old.message, hex(old.user_id));
+        END""",
+        f"""CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF message, user_id ON chat_history BEGIN
+            INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, message, owner)
+            VALUES ('delete', old.id, old.message, hex(old.user_id));
+            INSERT INTO {SEARCH_TABLE} (rowid, message, owner) VALUES (new.id, new.message, hex(new.user_id));
+        END""",
+        # Rank on the message only, then index the existing history in one pass
+        f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+    ):
+        conn.execute(sa.text(statement))
+    logging.info("Built the chat history full-text index")
+
+
+def archive_index(conn):
+    ArchivedConversation.__table__.create(conn, checkfirst=True)
+
+
+def sessions_table(conn):
+    # Only used with SESSION_BACKEND=database, which shares the chat database
+    SQLAlchemySessionBackend.sessions.create(conn, checkfirst=True)
+
+
+def assign_owners(conn, legacy_owner=None):
+    """Give ownerless history to ``legacy_owner`` and conversations to their owner.
+
+    History written before ownership existed has no user; it can be handed to
+    a single known owner (LEGACY_CHAT_OWNER by default), otherwise it stays
+    hidden from every user.
+    """
+    history, conversations = ChatHistory.__table__, Conversation.__table__
+    legacy_owner = legacy_owner or os.getenv("LEGACY_CHAT_OWNER")
+    if legacy_owner and not is_object_id(legacy_owner):
+        # Handing history to an id nobody signs in with would hide it for good
+        logging.error(f"Not assigning legacy history: {legacy_owner!r} is not an Entra object id (oid)")
+    elif legacy_owner:
+        updated = conn.execute(
+            sa.update(history).where(history.c.user_id.is_(None)).values(user_id=legacy_owner)
+        ).rowcount
+        if updated:
+            logging.info(f"Assigned {updated} legacy messages to {legacy_owner}")
+
+    owner = (
+        sa.select(history.c.user_id)
+        .where(history.c.session_id == conversations.c.session_id, history.c.user_id.is_not(None))
+        .limit(1)
+        .scalar_subquery()
+    )
+    conn.execute(sa.update(conversations).where(conversations.c.user_id.is_(None)).values(user_id=owner))
+
+
+def is_object_id(value):
+    # Signed-in users are stored by their oid claim, a GUID
+    try:
+        return str(uuid.UUID(value)) == value.lower()
+    except (TypeError, ValueError):
+        return False
+
+
+def reassign_owner(conn, old_owner, new_owner):
+    """Move every live and archived conversation of ``old_owner`` to ``new_owner``."""
+    total = 0
+    for table in (ChatHistory.__table__, Conversation.__table__, ArchivedConversation.__table__):
+        updated = conn.execute(
+            sa.update(table).where(table.c.user_id == old_owner).values(user_id=new_owner)
+        ).rowcount
+        logging.info(f"Moved {updated} {table.name} rows from {old_owner} to {new_owner}")
+        total += updated
+    return total
+
+
+# (version, description, function); append only, never renumber
+MIGRATIONS = [
+    (1, "chat_history and conversation tables", baseline),
+    (2, "backfill conversations from chat history", backfill_conversations),
+    (3, "full-text search index", search_index),
+    (4, "archived conversation index", archive_index),
+    (5, "server-side sessions table", sessions_table),
+    (6, "owners of legacy chat history", assign_owners),
+]
+
+
+@contextmanager
+def database_lock(conn, name, key, blocking=True):
+    """Hold a lock shared by every process using the database; yields whether it was taken.
+
+    PostgreSQL uses an advisory lock on ``key``, SQLite a lock file named
+    after the database and ``name``; both are released by the server or the
+    OS if the process dies while holding them.
+    """
+    if conn.dialect.name == "postgresql":
+        function = "pg_advisory_lock" if blocking else "pg_try_advisory_lock"
+        acquired = conn.execute(sa.text(f"SELECT {function}(:key)"), {"key": key}).scalar() is not False
+        conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(sa.text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+    elif conn.dialect.name == "sqlite" and conn.engine.url.database not in (None, "", ":memory:"):
+        with open(f"{conn.engine.url.database}.{name}.lock", "a+b") as lock_file:
+            if not _lock_file(lock_file, blocking):
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                _unlock_file(lock_file)
+    else:
+        yield True
+
+
+def _lock_file(lock_file, blocking):
+    # OS locks, so a crashed process never leaves the database locked
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.5)
+
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def run_migrations(engine):
+    """Apply pending migrations; returns the versions applied."""
+    applied = []
+    # Workers and nodes starting together must not migrate concurrently
+    with engine.connect() as conn, database_lock(conn, "migrate", MIGRATION_LOCK_ID):
+        schema_version.create(conn, checkfirst=True)
+        conn.commit()
+        current = conn.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+        conn.commit()
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            with conn.begin():
+                migrate(conn)
+                conn.execute(sa.insert(schema_version).values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+            logging.info(f"Applied migration {version}: {description}")
+            applied.append(version)
+    return applied
+
+
+def search_backend(engine):
+    """'fts5', 'tsvector' or None, depending on what the database provides."""
+    inspector = sa.inspect(engine)
+    if engine.dialect.name == "sqlite" and SEARCH_TABLE in inspector.get_table_names():
+        return "fts5"
+    if engine.dialect.name == "postgresql" and any(
+        column["name"] == "message_tsv" for column in inspector.get_columns("chat_history")
+    ):
+        return "tsvector"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--legacy-owner", metavar="OID",
+                        help="also give chat history without an owner to the user with this object id")
+    parser.add_argument("--reassign-owner", nargs=2, metavar=("OLD", "NEW"),
+                        help="move the chat history of one owner to another object id")
+    args = parser.parse_args()
+    for owner in [args.legacy_owner] + (args.reassign_owner[1:] if args.reassign_owner else []):
+        if owner and not is_object_id(owner):
+            parser.error(f"{owner} is not an Entra object id; owners are stored by their oid claim")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    instance_path = os.getenv("INSTANCE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+    os.makedirs(instance_path, exist_ok=True)
+    url = database_url(instance_path)
+    engine = sa.create_engine(url, **engine_options(url))
+    applied = run_migrations(engine)
+    logging.info(f"Applied migrations {applied}" if applied else "Schema is up to date")
+    if args.legacy_owner:
+        with engine.begin() as conn:
+            assign_owners(conn, args.legacy_owner)
+    if args.reassign_owner:
+        with engine.begin() as conn:
+            reassign_owner(conn, *args.reassign_owner)
+
+
+if __name__ == "__main__":
+    main()
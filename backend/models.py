@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
+
+db = SQLAlchemy()
+
+
+def database_url(instance_path, env_var="DATABASE_URL", default_file="chat_history.db"):
+    """Database URL from ``env_var``; relative SQLite paths live in the instance folder."""
+    url = os.getenv(env_var) or f"sqlite:///{default_file}"
+    # Some providers still hand out the scheme SQLAlchemy dropped
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database and parsed.database != ":memory:" \
+            and not os.path.isabs(parsed.database):
+        parsed = parsed.set(database=os.path.join(instance_path, parsed.database))
+    return parsed.render_as_string(hide_password=False)
+
+
+def engine_options(url):
+    """Connection pool settings; SQLite keeps SQLAlchemy's defaults."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        # Recycle before load balancers or the server drop idle connections
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
+class ChatHistory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), nullable=False)
+    user_id = db.Column(db.String(128))  # 'oid' (or email) of the owner
+    message = db.Column(db.Text, nullable=False)
+    sender = db.Column(db.String(10), nullable=False)  # 'user' or 'assistant'
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_chat_history_session_timestamp", "session_id", "timestamp"),
+        db.Index("ix_chat_history_session_sender_timestamp", "session_id", "sender", "timestamp"),
+        db.Index("ix_chat_history_user_timestamp", "user_id", "timestamp"),
+    )
+
+
+# One row per conversation, maintained by save_message so the sidebar never scans ChatHistory
+class Conversation(db.Model):
+    session_id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.String(128))
+    title = db.Column(db.String(50), nullable=False)
+    title_from_user = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    # Rolling summary of every message up to and including summarized_until
+    summary = db.Column(db.Text)
+    summarized_until = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_conversation_user_last_timestamp", "user_id", "last_timestamp", "session_id"),
+    )
+
+
+# Conversations moved out of the hot tables by retention.py; each row locates the
+# compressed frame of a monthly archive file that holds the conversation
+class ArchivedConversation(db.Model):
+    session_id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.String(128))
+    title = db.Column(db.String(50), nullable=False)
+    title_from_user = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    summary = db.Column(db.Text)
+    summarized_until = db.Column(db.DateTime)
+    message_count = db.Column(db.Integer, nullable=False)
+    archive_file = db.Column(db.String(100), nullable=False)  # relative to the archive folder
+    frame_offset = db.Column(db.BigInteger, nullable=False)
+    frame_length = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_archived_conversation_user_last_timestamp", "user_id", "last_timestamp", "session_id"),
+        db.Index("ix_archived_conversation_archive_file", "archive_file"),
+    )
+
+
+def conversation_title(message):
+    # Create a title from the first message - truncate to 50 chars
+    return message if len(message) <= 50 else message[:47] + "..."
@@ -0,0 +1,117 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from msal import SerializableTokenCache
+from msal_extensions import CrossPlatLock
+
+
+def _create_private_file(path):
+    # Refresh tokens are stored in clear text: keep the file readable by its owner only
+    if not os.path.exists(path):
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+
+class AccountTokenStore:
+    """MSAL token caches stored per account in an SQLite table.
+
+    Each row holds the serialized cache of one ``home_account_id``, so a login
+    only reads and writes its own account instead of the tokens of every user,
+    and workers do not queue on a lock shared by all logins. Accounts unused
+    for ``max_idle_days`` can no longer log in silently and are deleted by a
+    background sweeper.
+    """
+
+    def __init__(self, db_path, max_idle_days, sweep_interval=3600):
+        # SQLite gives the WAL and shared memory files the permissions of the database
+        _create_private_file(db_path)
+        self.max_idle_days = max_idle_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS token_caches (
+            home_account_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            last_used REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_token_caches_last_used ON token_caches (last_used)")
+        self._conn.commit()
+        if sweep_interval:
+            threading.Thread(
+                target=self._sweep, args=(sweep_interval,), name="token-cache-sweeper", daemon=True
+            ).start()
+
+    def _sweep(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                deleted = self.delete_idle(time.time())
+                if deleted:
+                    logging.info(f"Evicted the tokens of {deleted} idle accounts")
+            except Exception as e:
+                logging.error(f"Failed to evict idle token caches: {e}")
+
+    def load(self, home_account_id):
+        """Return the token cache of ``home_account_id``, empty if it has none."""
+        cache = SerializableTokenCache()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM token_caches WHERE home_account_id = ?", (home_account_id,)
+            ).fetchone()
+        if row is not None:
+            cache.deserialize(row[0])
+        return cache
+
+    def save(self, home_account_id, cache):
+        with self._lock:
+            if cache.has_state_changed:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO token_caches (home_account_id, data, last_used) VALUES (?, ?, ?)",
+                    (home_account_id, cache.serialize(), time.time())
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE token_caches SET last_used = ? WHERE home_account_id = ?", (time.time(), home_account_id)
+                )
+            self._conn.commit()
+
+    def delete(self, home_account_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM token_caches WHERE home_account_id = ?", (home_account_id,))
+            self._conn.commit()
+
+    def delete_idle(self, now):
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM token_caches WHERE last_used < ?", (now - self.max_idle_days * 86400,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+
+def load_http_cache(path):
+    """Load MSAL's HTTP cache (tenant discovery and metadata, no tokens)."""
+    try:
+        with CrossPlatLock(f"{path}.lockfile"):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable MSAL HTTP cache {path}: {e}")
+        return {}
+
+
+def save_http_cache(path, http_cache):
+    try:
+        with CrossPlatLock(f"{path}.lockfile"):
+            with open(path, "wb") as f:
+                pickle.dump(dict(http_cache), f)
+    except Exception as e:
+        logging.warning(f"Failed to persist MSAL HTTP cache {path}: {e}")
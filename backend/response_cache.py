@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ResponseCache:
+    """Semantic cache of chat answers.
+
+    Entries are grouped by a context key (hash of the employee rows sent as
+    context plus the completion model), so an answer is only ever reused for
+    the same user data. Within a group, a query hits when the cosine
+    similarity of its embedding with a cached query reaches ``threshold``.
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=10_000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # entry id -> (context_key, vector, response, expires_at)
+        self._groups = {}  # context_key -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id):
+        context_key = self._entries.pop(entry_id)[0]
+        group = self._groups[context_key]
+        group.discard(entry_id)
+        if not group:
+            del self._groups[context_key]
+
+    def lookup(self, query_embedding, context_key):
+        """Return the cached response closest to the query, or None."""
+        query = self._normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._groups.get(context_key, ())):
+                _, vector, _, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def store(self, query_embedding, context_key, response):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (
+                context_key, self._normalize(query_embedding), response, time.monotonic() + self.ttl
+            )
+            self._groups.setdefault(context_key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "threshold": self.threshold
+            }
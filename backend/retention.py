@@ -0,0 +1,357 @@
+"""Retention of the chat history: archival, purge and vacuum.
+
+Conversations idle for more than ``archive_after_days`` are moved out of the
+chat_history and conversation tables into one compressed JSONL file per
+month of last activity (zstd when the zstandard package is installed, gzip
+otherwise) and indexed in archived_conversation; switch_conversation moves
+them back on demand. Archive files whose month is older than
+``purge_after_days`` are deleted with their index rows. On SQLite the pages
+freed by these deletes are handed back to the file system by incremental
+vacuum.
+
+The app runs the job every RETENTION_INTERVAL seconds; with
+RETENTION_INTERVAL=0 run it from cron instead:
+
+    python retention.py
+
+Databases created before incremental vacuum was enabled need one full
+``python retention.py --full-vacuum`` (it locks the database while it runs).
+With several nodes, ARCHIVE_DIR must be on shared storage.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from migrations import database_lock
+from models import ArchivedConversation, ChatHistory, Conversation, database_url, engine_options
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_SUFFIX = ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+ARCHIVE_NAME = re.compile(r"chat-(\d{4})-(\d{2})\.jsonl\.(zst|gz)")
+# Arbitrary key of the PostgreSQL advisory lock keeping one job per database
+RETENTION_LOCK_ID = 4_204_202
+
+
+def _compress(data):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(name, data):
+    # Files written before zstandard was installed stay readable
+    if name.endswith(".gz"):
+        return gzip.decompress(data)
+    if zstandard is None:
+        raise RuntimeError(f"zstandard is required to read {name}")
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def delete_in_batches(engine, table, condition, batch_size=1000):
+    """DELETE the rows of ``table`` matching ``condition``, ``batch_size`` rows per transaction.
+
+    Short transactions keep the SQLite write lock (or PostgreSQL row locks)
+    from stalling the message writer while a large delete runs.
+    """
+    key = table.primary_key.columns[0]
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            deleted = conn.execute(
+                sa.delete(table).where(key.in_(sa.select(key).where(condition).limit(batch_size)))
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+class Retention:
+    """Archives idle conversations, purges old archives and vacuums the database.
+
+    Each archive batch is one transaction: the conversations are claimed by
+    deleting them, their messages are appended to the month file as a single
+    compressed frame, then indexed and deleted. A failed batch is rolled back
+    and the frame truncated away. 0 days disables a policy.
+    """
+
+    def __init__(self, engine, archive_dir, archive_after_days=0, purge_after_days=0, batch_size=200,
+                 vacuum_pages=2000):
+        # Purge age is counted from last activity, like archival
+        if archive_after_days and purge_after_days and purge_after_days <= archive_after_days:
+            raise ValueError("purge_after_days must be larger than archive_after_days")
+        self.engine = engine
+        self.archive_dir = archive_dir
+        self.archive_after_days = archive_after_days
+        self.purge_after_days = purge_after_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.archived = 0
+        self.restored = 0
+        self.purged = 0
+        self._vacuum_hint_logged = False
+
+    def start(self, interval):
+        threading.Thread(target=self._loop, args=(interval,), name="retention", daemon=True).start()
+
+    def _loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.run()
+            except Exception as e:
+                logging.error(f"Retention job failed: {e}")
+
+    def run(self):
+        """One pass of every policy; skipped while another process runs it."""
+        with self.engine.connect() as conn, \
+                database_lock(conn, "retention", RETENTION_LOCK_ID, blocking=False) as acquired:
+            if not acquired:
+                return False
+            now = datetime.utcnow()
+            if self.archive_after_days:
+                self.archive_idle(now - timedelta(days=self.archive_after_days))
+            if self.purge_after_days:
+                self.purge_archives(now - timedelta(days=self.purge_after_days))
+            self.vacuum()
+            return True
+
+    def archive_idle(self, cutoff):
+        """Archive every conversation whose last message is older than ``cutoff``."""
+        total = 0
+        while True:
+            archived = self._archive_batch(cutoff)
+            if not archived:
+                break
+            total += archived
+        if total:
+            self.archived += total
+            logging.info(f"Archived {total} conversations idle since {cutoff:%Y-%m-%d}")
+        return total
+
+    def _archive_batch(self, cutoff):
+        conversations = Conversation.__table__
+        messages = ChatHistory.__table__
+        os.makedirs(self.archive_dir, exist_ok=True)
+        appended = []  # (path, size before the frame), to undo a failed batch
+        try:
+            with self.engine.begin() as conn:
+                # Claiming by DELETE takes the write lock up front, so the message
+                # writer cannot touch these conversations until the batch commits
+                claimed = conn.execute(
+                    sa.delete(conversations)
+                    .where(conversations.c.session_id.in_(
+                        sa.select(conversations.c.session_id)
+                        .where(conversations.c.last_timestamp < cutoff)
+                        .limit(self.batch_size)
+                    ))
+                    .returning(*conversations.c)
+                ).mappings().all()
+                if not claimed:
+                    return 0
+
+                session_ids = [row["session_id"] for row in claimed]
+                history = defaultdict(list)
+                for row in conn.execute(
+                    sa.select(messages.c.session_id, messages.c.user_id, messages.c.sender,
+                              messages.c.message, messages.c.timestamp)
+                    .where(messages.c.session_id.in_(session_ids))
+                    .order_by(messages.c.session_id, messages.c.timestamp, messages.c.id)
+                ):
+                    history[row.session_id].append({
+                        "user_id": row.user_id,
+                        "sender": row.sender,
+                        "message": row.message,
+                        "timestamp": row.timestamp.isoformat() if row.timestamp else None
+                    })
+
+                by_month = defaultdict(list)
+                for row in claimed:
+                    by_month[f"chat-{row['last_timestamp']:%Y-%m}{ARCHIVE_SUFFIX}"].append(row)
+                archived_at = datetime.utcnow()
+                index_rows = []
+                for name, rows in by_month.items():
+                    lines = "".join(
+                        json.dumps({
+                            "session_id": row["session_id"],
+                            "user_id": row["user_id"],
+                            "title": row["title"],
+                            "created_at": row["created_at"].isoformat(),
+                            "last_timestamp": row["last_timestamp"].isoformat(),
+                            "messages": history[row["session_id"]]
+                        }, ensure_ascii=False) + "\n"
+                        for row in rows
+                    )
+                    frame = _compress(lines.encode("utf-8"))
+                    offset = self._append(name, frame, appended)
+                    index_rows += [
+                        dict(row, message_count=len(history[row["session_id"]]), archive_file=name,
+                             frame_offset=offset, frame_length=len(frame), archived_at=archived_at)
+                        for row in rows
+                    ]
+                conn.execute(sa.insert(ArchivedConversation.__table__), index_rows)
+                conn.execute(sa.delete(messages).where(messages.c.session_id.in_(session_ids)))
+            return len(claimed)
+        except BaseException:
+            for path, size in appended:
+                with open(path, "r+b") as archive:
+                    archive.truncate(size)
+            raise
+
+    def _append(self, name, frame, appended):
+        path = os.path.join(self.archive_dir, name)
+        with open(path, "ab") as archive:
+            offset = archive.tell()
+            appended.append((path, offset))
+            archive.write(frame)
+            archive.flush()
+            # The frame must be on disk before the rows it replaces are deleted
+            os.fsync(archive.fileno())
+        return offset
+
+    def read(self, entry):
+        """The archived record (metadata and messages) of an archived_conversation row."""
+        with open(os.path.join(self.archive_dir, entry["archive_file"]), "rb") as archive:
+            archive.seek(entry["frame_offset"])
+            frame = archive.read(entry["frame_length"])
+        for line in _decompress(entry["archive_file"], frame).decode("utf-8").splitlines():
+            record = json.loads(line)
+            if record["session_id"] == entry["session_id"]:
+                return record
+        raise LookupError(f"Conversation {entry['session_id']} missing from {entry['archive_file']}")
+
+    def restore(self, session_id, user_id):
+        """Move an archived conversation of ``user_id`` back to the hot tables.
+
+        Returns False when there is no such archived conversation. The
+        restored conversation counts as active again, so it is not archived
+        by the next pass.
+        """
+        archived = ArchivedConversation.__table__
+        with self.engine.begin() as conn:
+            entry = conn.execute(
+                sa.delete(archived)
+                .where(archived.c.session_id == session_id, archived.c.user_id == user_id)
+                .returning(*archived.c)
+            ).mappings().first()
+            if entry is None:
+                return False
+            record = self.read(entry)
+            conn.execute(sa.insert(Conversation.__table__).values(
+                session_id=entry["session_id"],
+                user_id=entry["user_id"],
+                title=entry["title"],
+                title_from_user=entry["title_from_user"],
+                created_at=entry["created_at"],
+                last_timestamp=datetime.utcnow(),
+                summary=entry["summary"],
+                summarized_until=entry["summarized_until"]
+            ))
+            if record["messages"]:
+                conn.execute(sa.insert(ChatHistory.__table__), [
+                    {
+                        "session_id": session_id,
+                        # The index row is authoritative: owner reassignments only update it
+                        "user_id": entry["user_id"],
+                        "sender": message["sender"],
+                        "message": message["message"],
+                        "timestamp": datetime.fromisoformat(message["timestamp"]) if message["timestamp"] else None
+                    }
+                    for message in record["messages"]
+                ])
+        self.restored += 1
+        logging.info(f"Restored archived conversation {session_id} ({len(record['messages'])} messages)")
+        return True
+
+    def purge_archives(self, cutoff):
+        """Delete the archive files, and their index rows, of months ending before ``cutoff``."""
+        if not os.path.isdir(self.archive_dir):
+            return 0
+        archived = ArchivedConversation.__table__
+        total = 0
+        for name in sorted(os.listdir(self.archive_dir)):
+            match = ARCHIVE_NAME.fullmatch(name)
+            if not match:
+                continue
+            year, month = int(match.group(1)), int(match.group(2))
+            month_end = datetime(year + month // 12, month % 12 + 1, 1)
+            if month_end > cutoff:
+                continue
+            # Index rows first: a crash in between leaves a file the next pass removes
+            total += delete_in_batches(self.engine, archived, archived.c.archive_file == name, self.batch_size)
+            os.remove(os.path.join(self.archive_dir, name))
+            logging.info(f"Purged archive {name}")
+        self.purged += total
+        return total
+
+    def vacuum(self):
+        """Release up to ``vacuum_pages`` free pages of an SQLite database; returns the count."""
+        if self.engine.dialect.name != "sqlite" or not self.vacuum_pages:
+            return 0  # PostgreSQL's autovacuum reclaims dead rows on its own
+        with self.engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                if not self._vacuum_hint_logged:
+                    logging.info("Incremental vacuum is off for this database; run `python retention.py --full-vacuum`")
+                    self._vacuum_hint_logged = True
+                return 0
+            pages = min(conn.exec_driver_sql("PRAGMA freelist_count").scalar(), self.vacuum_pages)
+            if pages:
+                # sqlite3's execute() steps the pragma once, freeing a single page;
+                # executescript() runs it to completion
+                conn.commit()
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+                logging.info(f"Released {pages} free pages of the chat database")
+            return pages
+
+
+def full_vacuum(engine):
+    """Rebuild an SQLite database with incremental vacuum enabled."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    instance_path = os.getenv("INSTANCE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive-after-days", type=int, default=int(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", "0")))
+    parser.add_argument("--purge-after-days", type=int, default=int(os.getenv("RETENTION_PURGE_AFTER_DAYS", "0")))
+    parser.add_argument("--archive-dir", default=os.getenv("ARCHIVE_DIR", os.path.join(instance_path, "archive")))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("RETENTION_BATCH_SIZE", "200")))
+    parser.add_argument("--vacuum-pages", type=int, default=int(os.getenv("RETENTION_VACUUM_PAGES", "2000")))
+    parser.add_argument("--full-vacuum", action="store_true", help="rebuild the SQLite database with incremental vacuum")
+    args = parser.parse_args()
+
+    url = database_url(instance_path)
+    engine = sa.create_engine(url, **engine_options(url))
+    if args.full_vacuum:
+        if engine.dialect.name != "sqlite":
+            parser.error("--full-vacuum only applies to SQLite")
+        started = time.perf_counter()
+        full_vacuum(engine)
+        logging.info(f"Vacuumed the chat database in {time.perf_counter() - started:.1f}s")
+        return
+
+    retention = Retention(engine, args.archive_dir, args.archive_after_days, args.purge_after_days,
+                          args.batch_size, args.vacuum_pages)
+    if not retention.run():
+        logging.info("Retention is already running elsewhere")
+        return
+    logging.info(f"Archived {retention.archived} conversations, purged {retention.purged} archived conversations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the session to a new id, e.g. after login to prevent fixation."""
+        self.previous_sid = self.previous_sid or self.sid
+        self.sid = uuid.uuid4().hex
+        self.modified = True
+
+
+class SQLiteSessionBackend:
+    """Sessions stored as serialized rows in an SQLite table.
+
+    Every write stores a new ``version``; ``load`` only returns the payload
+    when it differs from the version the caller already holds, so the
+    in-memory front can skip both the transfer and the deserialization.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        self._conn.commit()
+
+    def load(self, sid, known_version=None):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT version, expires_at, CASE WHEN version = ? THEN NULL ELSE data END "
+                "FROM sessions WHERE id = ?",
+                (known_version, sid)
+            ).fetchone()
+
+    def save(self, sid, data, expires_at):
+        version = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, version, data, expires_at) VALUES (?, ?, ?, ?)",
+                (sid, version, data, expires_at)
+            )
+            self._conn.commit()
+        return version
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, sid))
+            self._conn.commit()
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self._conn.commit()
+
+    def delete_expired(self, now):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+            self._conn.commit()
+        return deleted
+
+
+class SQLAlchemySessionBackend:
+    """Sessions in a ``sessions`` table of any SQLAlchemy database.
+
+    Lets every node behind a load balancer see the same sessions; same
+    versioning scheme as ``SQLiteSessionBackend``. The table is created by
+    the chat database migrations.
+    """
+
+    metadata = sa.MetaData()
+    sessions = sa.Table(
+        "sessions", metadata,
+        sa.Column("id", sa.String(64), primary_key=True),
+        sa.Column("version", sa.String(32), nullable=False),
+        sa.Column("data", sa.Text, nullable=False),
+        sa.Column("expires_at", sa.Float, nullable=False, index=True),
+    )
+
+    def __init__(self, url, engine_options=None):
+        self.engine = sa.create_engine(url, **(engine_options or {}))
+
+    def load(self, sid, known_version=None):
+        table = self.sessions
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sa.select(
+                    table.c.version, table.c.expires_at,
+                    sa.case((table.c.version == known_version, None), else_=table.c.data)
+                ).where(table.c.id == sid)
+            ).first()
+
+    def save(self, sid, data, expires_at):
+        version = uuid.uuid4().hex
+        values = {"version": version, "data": data, "expires_at": expires_at}
+        table = self.sessions
+        # Portable upsert: update, insert if missing, update again if another node won the insert
+        with self.engine.begin() as conn:
+            if conn.execute(sa.update(table).where(table.c.id == sid).values(values)).rowcount:
+                return version
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(sa.insert(table).values(id=sid, **values))
+        except sa.exc.IntegrityError:
+            with self.engine.begin() as conn:
+                conn.execute(sa.update(table).where(table.c.id == sid).values(values))
+        return version
+
+    def touch(self, sid, expires_at):
+        with self.engine.begin() as conn:
+            conn.execute(sa.update(self.sessions).where(self.sessions.c.id == sid).values(expires_at=expires_at))
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(self.sessions).where(self.sessions.c.id == sid))
+
+    def delete_expired(self, now):
+        with self.engine.begin() as conn:
+            return conn.execute(sa.delete(self.sessions).where(self.sessions.c.expires_at < now)).rowcount
+
+
+class MemorySessionBackend:
+    """Process-local backend with the same interface, for development and tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def load(self, sid, known_version=None):
+        with self._lock:
+            row = self._rows.get(sid)
+        if row is None:
+            return None
+        version, expires_at, data = row
+        return version, expires_at, None if version == known_version else data
+
+    def save(self, sid, data, expires_at):
+        version = uuid.uuid4().hex
+        with self._lock:
+            self._rows[sid] = (version, expires_at, data)
+        return version
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            if sid in self._rows:
+                version, _, data = self._rows[sid]
+                self._rows[sid] = (version, expires_at, data)
+
+    def delete(self, sid):
+        with self._lock:
+            self._rows.pop(sid, None)
+
+    def delete_expired(self, now):
+        with self._lock:
+            expired = [sid for sid, row in self._rows.items() if row[1] < now]
+            for sid in expired:
+                del self._rows[sid]
+        return len(expired)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in ``backend``; the cookie only holds a signed session id.
+
+    Sessions expire after ``PERMANENT_SESSION_LIFETIME`` seconds without a
+    request. Deserialized sessions are kept in a per-process LRU of
+    ``cache_size`` entries and reused while their stored version is unchanged.
+    """
+
+    def __init__(self, backend, cache_size=1024, sweep_interval=300):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # sid -> (version, data)
+        self._cache_lock = threading.Lock()
+        if sweep_interval:
+            threading.Thread(
+                target=self._sweep, args=(sweep_interval,), name="session-sweeper", daemon=True
+            ).start()
+
+    def _sweep(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                deleted = self.backend.delete_expired(time.time())
+                if deleted:
+                    logging.info(f"Expired {deleted} idle sessions")
+            except Exception as e:
+                logging.error(f"Failed to sweep expired sessions: {e}")
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="server-side-session")
+
+    def _remember(self, sid, version, data):
+        with self._cache_lock:
+            self._cache[sid] = (version, data)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._cache_lock:
+            self._cache.pop(sid, None)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+        try:
+            sid = self._signer(app).unsign(cookie).decode("utf-8")
+        except BadSignature:
+            return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+
+        with self._cache_lock:
+            cached = self._cache.get(sid)
+        row = self.backend.load(sid, cached[0] if cached else None)
+        if row is None or row[1] < time.time():
+            self._forget(sid)
+            return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+
+        version, expires_at, payload = row
+        if payload is None:
+            data = cached[1]
+        else:
+            data = session_json_serializer.loads(payload)
+            self._remember(sid, version, data)
+
+        session = ServerSideSession(dict(data), sid=sid)
+        session.expires_at = expires_at
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+
+        if session.previous_sid:
+            self.backend.delete(session.previous_sid)
+            self._forget(session.previous_sid)
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+                self._forget(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        if session.modified or session.new:
+            version = self.backend.save(session.sid, session_json_serializer.dumps(dict(session)), now + lifetime)
+            self._remember(session.sid, version, dict(session))
+        elif getattr(session, "expires_at", now) - now < lifetime / 2:
+            # Sliding expiry, written at most twice per lifetime instead of on every request
+            self.backend.touch(session.sid, now + lifetime)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode("utf-8"),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
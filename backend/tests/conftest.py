@@ -0,0 +1,115 @@
+"""Shared fixtures; run from the backend folder with ``python -m pytest``.
+
+The app is loaded once per session the way the bench loads it: MSAL is
+replaced by the bench identity provider and Azure OpenAI by the fake server.
+Chat data goes to an SQLite file in a temporary instance folder, or to
+TEST_DATABASE_URL, which is emptied first:
+
+    TEST_DATABASE_URL=postgresql://hr:hr@localhost/hr_test python -m pytest
+"""
+import os
+import sys
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_openai import start_fake_openai  # noqa: E402
+from bench.seed import bench_email, seed_employees  # noqa: E402
+from hr_store import HRStore  # noqa: E402
+from import_hr import import_employees  # noqa: E402
+
+EMPLOYEES = 20
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    from bench.run import load_app
+
+    instance_path = str(tmp_path_factory.mktemp("instance"))
+    seed_employees(os.path.join(instance_path, "rh_database.db"), EMPLOYEES)
+    fake_openai = start_fake_openai(latency=0, tokens_per_second=10_000, completion_tokens=10)
+    database_url = os.getenv("TEST_DATABASE_URL")
+    if database_url:
+        engine = sa.create_engine(database_url)
+        metadata = sa.MetaData()
+        metadata.reflect(engine)
+        metadata.drop_all(engine)
+        engine.dispose()
+        os.environ["DATABASE_URL"] = database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+    # Retention runs only when a test calls it
+    os.environ["RETENTION_INTERVAL"] = "0"
+    load_app(instance_path, f"http://127.0.0.1:{fake_openai.server_port}")
+    import app as module
+
+    yield module
+    fake_openai.shutdown()
+
+
+@pytest.fixture(scope="session")
+def engine(app_module):
+    with app_module.app.app_context():
+        return app_module.db.engine
+
+
+@pytest.fixture
+def login(app_module):
+    """Return a test client signed in as the bench employee with the given index."""
+    def login(index=0):
+        client = app_module.app.test_client()
+        response = client.get("/login")
+        state = parse_qs(urlparse(response.headers["Location"]).query)["state"][0]
+        response = client.get("/getAToken", query_string={"code": bench_email(index), "state": state})
+        assert response.status_code == 302
+        return client
+    return login
+
+
+@pytest.fixture
+def add_conversation(app_module, engine):
+    """Write a conversation through the message writer; returns its session id.
+
+    With ``last_active``, the messages and the conversation are backdated to it.
+    """
+    def add_conversation(user_id, messages, last_active=None):
+        session_id = str(uuid.uuid4())
+        for i, message in enumerate(messages):
+            app_module.save_message(session_id, user_id, message, "user" if i % 2 == 0 else "assistant")
+        assert app_module.message_writer.flush(timeout=5)
+        if last_active is not None:
+            with engine.begin() as conn:
+                conn.execute(
+                    sa.update(app_module.ChatHistory.__table__)
+                    .where(app_module.ChatHistory.session_id == session_id)
+                    .values(timestamp=last_active)
+                )
+                conn.execute(
+                    sa.update(app_module.Conversation.__table__)
+                    .where(app_module.Conversation.session_id == session_id)
+                    .values(created_at=last_active, last_timestamp=last_active)
+                )
+        return session_id
+    return add_conversation
+
+
+@pytest.fixture
+def employee():
+    """Return a builder of HR records: ``employee(i, **columns)``."""
+    def employee(i, **fields):
+        return {"email": f"employee{i}@example.com", "full_name": f"Employee {i}", **fields}
+    return employee
+
+
+@pytest.fixture
+def make_store(tmp_path, employee):
+    """Import ``count`` employees into a new HR database; returns its path and an HRStore on it."""
+    def make_store(count=3, name="rh_database.db", **options):
+        db_path = str(tmp_path / name)
+        import_employees(db_path, [employee(i) for i in range(count)])
+        return db_path, HRStore(db_path, **options)
+    return make_store
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+import conversation_memory
+from models import Conversation
+
+
+def turn(size, timestamp=None):
+    # One token per character, plus the per-message overhead
+    return {"sender": "user", "message": "x" * size, "timestamp": timestamp}
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(conversation_memory, "count_tokens", lambda text, model=None: len(text))
+
+
+def sizes(turns):
+    return [len(t["message"]) for t in turns]
+
+
+def test_turns_within_the_budget_are_all_kept(char_tokens):
+    turns = [turn(20), turn(30), turn(26)]  # 76 + 3 * 4 = 88 tokens
+
+    assert conversation_memory.split_turns(turns, budget=88) == ([], turns)
+
+
+def test_the_oldest_turns_are_folded_down_to_the_target(char_tokens):
+    turns = [turn(36), turn(16), turn(16), turn(16)]  # 40 + 3 * 20 = 100 tokens
+
+    to_fold, kept = conversation_memory.split_turns(turns, budget=90, target_ratio=0.5)
+
+    assert sizes(to_fold) == [36, 16] and sizes(kept) == [16, 16]
+
+
+def test_the_latest_turn_is_always_kept(char_tokens):
+    turns = [turn(10), turn(500)]
+
+    to_fold, kept = conversation_memory.split_turns(turns, budget=100)
+
+    assert sizes(to_fold) == [10] and sizes(kept) == [500]
+    assert conversation_memory.split_turns([], budget=100) == ([], [])
+
+
+def stored_summary(engine, session_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(Conversation.summary, Conversation.summarized_until).where(Conversation.session_id == session_id)
+        ).one()
+
+
+def test_fold_summary_only_replaces_the_summary_it_started_from(app_module, engine, add_conversation, monkeypatch):
+    monkeypatch.setattr(app_module.conversation_memory, "summarize", lambda summary, turns, complete: f"{summary}+")
+    session_id = add_conversation("user11@bench.local", ["Question", "Answer"])
+    first, second = datetime(2024, 1, 1), datetime(2024, 1, 2)
+
+    app_module.fold_summary(session_id, "s", None, [turn(1, first)])
+    assert tuple(stored_summary(engine, session_id)) == ("s+", first)
+
+    # A fold that started before the first one was committed is discarded
+    app_module.fold_summary(session_id, "stale", None, [turn(1, second)])
+    assert tuple(stored_summary(engine, session_id)) == ("s+", first)
+
+    app_module.fold_summary(session_id, "s+", first, [turn(1, second)])
+    assert tuple(stored_summary(engine, session_id)) == ("s++", second)
+    assert session_id not in app_module.summaries_in_progress
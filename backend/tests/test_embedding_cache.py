@@ -0,0 +1,21 @@
+from embedding_cache import EmbeddingCache
+
+
+def embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_tables_do_not_evict_each_other(tmp_path):
+    db_path = str(tmp_path / "embedding_cache.db")
+    corpus = EmbeddingCache(db_path, max_entries=3, hot_entries=0)
+    queries = EmbeddingCache(db_path, max_entries=2, hot_entries=0, table="query_embeddings")
+    policies = ["leave policy", "remote work policy", "expenses policy"]
+    corpus.get_many(policies, "model", embed)
+
+    for i in range(10):
+        queries.get_many([f"question {i}"], "model", embed)
+
+    corpus.get_many(policies, "model", embed)
+    assert (corpus.hits, corpus.misses) == (3, 3)
+    queries.get_many(["question 9", "question 0"], "model", embed)
+    assert (queries.hits, queries.misses) == (1, 11)
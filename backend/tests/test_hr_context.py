@@ -0,0 +1,34 @@
+import pytest
+
+from hr_context import FIELDS, EmployeeContext
+
+LEAVE = ("full_name", "vacation_days", "days_taken", "days_left")
+
+
+@pytest.mark.parametrize("query, columns", [
+    ("How many vacation days do I have left?", LEAVE),
+    ("Can I take a day off on Friday?", LEAVE),
+    ("Combien de jours de congés me reste-t-il ?", LEAVE),
+    ("Quand puis-je poser mes vacances ?", LEAVE),
+    ("When did I join the company?", ("full_name", "hire_date")),
+    ("Depuis quand suis-je embauchée ?", ("full_name", "hire_date")),
+    ("What is my job title?", ("full_name", "position")),
+    ("Quelle est mon adresse e-mail ?", ("full_name", "email")),
+    ("When was I hired and what is my role?", ("full_name", "position", "hire_date")),
+])
+def test_columns_follow_the_question(query, columns):
+    assert EmployeeContext.columns_for(query) == columns
+
+
+@pytest.mark.parametrize("query", [
+    "What should I do today?",
+    "Is the office open on Monday?",
+    "Do I need to restart my laptop?",
+    "Is there a steam room?",
+    "Bonjour !",
+    "",
+    None,
+])
+def test_keywords_inside_other_words_do_not_match(query):
+    # No topic: every column is sent
+    assert EmployeeContext.columns_for(query) == tuple(FIELDS)
@@ -0,0 +1,40 @@
+import time
+
+from import_hr import import_employees
+
+
+def test_connections_beyond_the_pool_keep_the_cache(make_store):
+    _, store = make_store(pool_size=1)
+    store.get_employee_rows("employee0@example.com")
+
+    # Two requests at once: the second opens a connection the pool cannot keep
+    with store._connection(), store._connection():
+        pass
+    store.get_employee_rows("employee0@example.com")
+
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_commits_clear_the_cache(make_store, employee):
+    db_path, store = make_store(pool_size=1)
+    assert store.get_employee_rows("employee0@example.com")[0]["days_taken"] == 0
+
+    import_employees(db_path, [employee(0, days_taken=4)])
+    # Seen by a connection opened after the commit as well as by the pooled one
+    with store._connection(), store._connection():
+        pass
+    assert store._cache.get("employee0@example.com", time.monotonic()) is None
+    assert store.get_employee_rows("employee0@example.com")[0]["days_taken"] == 4
+
+
+def test_cache_is_bounded_and_drops_expired_entries(make_store):
+    _, store = make_store(cache_max_entries=2)
+    for i in (0, 1, 0, 2):
+        store.get_employee_rows(f"employee{i}@example.com")
+    assert list(store._cache._entries) == ["employee0@example.com", "employee2@example.com"]
+
+    _, expiring = make_store(name="expiring.db", cache_ttl=0)
+    expiring.get_employee_rows("employee0@example.com")
+    expiring.get_employee_rows("employee0@example.com")
+    assert expiring.misses == 2
+    assert expiring._cache.get("employee0@example.com", time.monotonic()) is None
@@ -0,0 +1,44 @@
+import sqlite3
+
+from import_hr import import_employees
+
+
+def emails(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT email FROM employees")}
+
+
+def test_prune_deletes_employees_missing_from_the_input(tmp_path, employee):
+    db_path = str(tmp_path / "rh_database.db")
+    import_employees(db_path, [employee(i) for i in range(3)])
+
+    counters = import_employees(db_path, [employee(0), employee(1)], prune=True)
+
+    assert counters["deleted"] == 1
+    assert emails(db_path) == {"employee0@example.com", "employee1@example.com"}
+
+
+def test_prune_is_refused_when_records_are_skipped(tmp_path, employee):
+    db_path = str(tmp_path / "rh_database.db")
+    import_employees(db_path, [employee(i) for i in range(3)])
+
+    # employee2 is still employed but their record has a bad value this time
+    counters = import_employees(
+        db_path, [employee(0, days_taken=3), employee(1), employee(2, vacation_days="n/a")], prune=True
+    )
+
+    assert counters["skipped"] == 1 and counters["deleted"] == 0 and counters["updated"] == 1
+    assert emails(db_path) == {f"employee{i}@example.com" for i in range(3)}
+
+
+def test_duplicate_emails_are_counted_once(tmp_path, employee):
+    db_path = str(tmp_path / "rh_database.db")
+
+    counters = import_employees(db_path, [employee(0), employee(0, days_taken=2), employee(1)])
+
+    assert (counters["inserted"], counters["unchanged"], counters["duplicates"]) == (2, 0, 1)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT days_taken FROM employees WHERE email = 'employee0@example.com'").fetchone() == (2,)
+
+    counters = import_employees(db_path, [employee(1), employee(1)])
+    assert (counters["updated"], counters["unchanged"], counters["duplicates"]) == (0, 1, 1)
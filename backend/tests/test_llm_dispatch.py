@@ -0,0 +1,199 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from llm_dispatch import (
+    BULK, INTERACTIVE, LLMDispatcher, LLMUnavailableError, RateLimiter, TokenBucket, retry_after_seconds
+)
+
+URL = "https://example.openai.azure.com/openai/deployments/gpt/chat/completions"
+
+
+def rate_limit_error(headers):
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", URL))
+    return openai.RateLimitError("Too Many Requests", response=response, body=None)
+
+
+def completion(text, total_tokens=10):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(total_tokens=total_tokens)
+    )
+
+
+class StubClient:
+    """OpenAI client whose chat completions are answered by ``handler(**kwargs)``."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls.append((time.monotonic(), kwargs))
+        return self.handler(**kwargs)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def messages(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_identical_calls_in_flight_share_one_request():
+    release = threading.Event()
+
+    def handler(**kwargs):
+        release.wait(5)
+        return completion("answer")
+
+    client = StubClient(handler)
+    dispatcher = LLMDispatcher(client)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(dispatcher.chat("gpt", messages("same question"))))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: dispatcher.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(client.calls) == 1
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    # Once the call is over, the same question goes upstream again
+    dispatcher.chat("gpt", messages("same question"))
+    assert len(client.calls) == 2
+
+
+def test_token_bucket_waits_for_capacity():
+    bucket = TokenBucket(per_minute=600)
+    now = bucket.updated
+    assert bucket.capacity == 100 and bucket.wait_time(100, now) == 0
+
+    bucket.take(100)
+    assert bucket.wait_time(20, now) == pytest.approx(2.0)
+    assert bucket.wait_time(20, now + 1) == pytest.approx(1.0)
+    # Calls larger than the bucket only wait for it to be full
+    assert bucket.wait_time(1000, now + 1) == pytest.approx(9.0)
+
+
+def test_limiter_waits_for_tokens_then_gives_up_at_the_deadline():
+    limiter = RateLimiter(tpm=600)
+    limiter.acquire(100, INTERACTIVE, time.monotonic() + 1)
+
+    started = time.monotonic()
+    limiter.acquire(3, INTERACTIVE, time.monotonic() + 1)
+    assert time.monotonic() - started >= 0.25
+
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        limiter.acquire(100, INTERACTIVE, time.monotonic() + 0.1)
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after > 0.1
+
+
+def test_interactive_calls_are_served_before_bulk():
+    limiter = RateLimiter(rpm=600)
+    limiter.requests.level = 0
+    order = []
+
+    def acquire(priority, name):
+        limiter.acquire(0, priority, time.monotonic() + 5)
+        order.append(name)
+
+    bulk = threading.Thread(target=acquire, args=(BULK, "bulk"))
+    bulk.start()
+    wait_for(lambda: limiter.waiting == 1)
+    interactive = threading.Thread(target=acquire, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    bulk.join()
+    interactive.join()
+
+    assert order == ["interactive", "bulk"]
+
+
+def test_retry_after_header():
+    assert retry_after_seconds(rate_limit_error({"retry-after": "7"})) == 7
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "250", "retry-after": "1"})) == 0.25
+    assert retry_after_seconds(rate_limit_error({})) is None
+
+
+def test_retry_after_blocks_every_caller():
+    throttled = threading.Event()
+
+    def handler(messages, **kwargs):
+        if messages[0]["content"] == "first" and not throttled.is_set():
+            throttled.set()
+            raise rate_limit_error({"retry-after": "0.3"})
+        return completion("answer")
+
+    client = StubClient(handler)
+    dispatcher = LLMDispatcher(client, max_wait=5)
+    first = threading.Thread(target=dispatcher.chat, args=("gpt", messages("first")))
+    first.start()
+    throttled.wait(5)
+    throttled_at = client.calls[0][0]
+    dispatcher.chat("gpt", messages("second"))
+    first.join()
+
+    assert dispatcher.retries == 1
+    assert len(client.calls) == 3
+    # The other caller waited for the Retry-After as well
+    assert all(called_at >= throttled_at + 0.3 for called_at, _ in client.calls[1:])
+
+
+def test_exhausted_quota_is_reported_as_429():
+    def handler(**kwargs):
+        raise rate_limit_error({"retry-after": "5"})
+
+    client = StubClient(handler)
+    dispatcher = LLMDispatcher(client, max_wait=1)
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        dispatcher.chat("gpt", messages("question"))
+
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 5
+    assert len(client.calls) == 1 and dispatcher.rejected == 1
+
+
+@pytest.mark.parametrize("error", [
+    openai.APIConnectionError(request=httpx.Request("POST", URL)),
+    openai.InternalServerError(
+        "Service Unavailable", response=httpx.Response(503, request=httpx.Request("POST", URL)), body=None
+    ),
+])
+def test_failing_service_is_reported_as_503(error):
+    def handler(**kwargs):
+        raise error
+
+    client = StubClient(handler)
+    dispatcher = LLMDispatcher(client, max_retries=2, base_delay=0.01)
+    with pytest.raises(LLMUnavailableError) as excinfo:
+        dispatcher.chat("gpt", messages("question"))
+
+    assert excinfo.value.status == 503
+    assert len(client.calls) == 3
+    assert dispatcher.retries == 2 and dispatcher.rejected == 1
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_process_input_returns_the_dispatcher_status(app_module, login, monkeypatch, status):
+    def unavailable(*args, **kwargs):
+        raise LLMUnavailableError("Azure OpenAI unavailable", status, 2.4)
+
+    monkeypatch.setattr(app_module.llm, "chat", unavailable)
+    response = login().post("/process_input", json={"query": f"How many vacation days do I have? {status}"})
+
+    assert response.status_code == status
+    assert response.headers["Retry-After"] == "2"
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+import sqlalchemy as sa
+
+from message_writer import MessageWriter
+from models import ChatHistory
+
+
+def message(text, session_id="s1"):
+    return {"session_id": session_id, "user_id": "u1", "message": text, "sender": "user", "timestamp": None}
+
+
+class FlakyStore:
+    """persist_batch stand-in that fails while ``error`` returns an exception for the batch."""
+
+    def __init__(self, error):
+        self.error = error
+        self.saved = []
+        self.lock = threading.Lock()
+
+    def persist_batch(self, batch):
+        error = self.error(batch)
+        if error is not None:
+            raise error
+        with self.lock:
+            self.saved += [m["message"] for m in batch]
+
+
+def locked():
+    return sa.exc.OperationalError("INSERT", {}, Exception("database is locked"))
+
+
+def nul_rejected():
+    # Raised by psycopg2 before the statement reaches the server, so SQLAlchemy does not wrap it
+    return ValueError("A string literal cannot contain NUL (0x00) characters.")
+
+
+@pytest.fixture
+def writer_for(app_module):
+    writers = []
+
+    def writer_for(store, **options):
+        options = {"flush_interval": 0.01, "retry_delay": 0.01, "max_retry_delay": 0.05, "max_attempts": 3,
+                   "is_permanent": app_module.permanent_write_error, **options}
+        writer = MessageWriter(store.persist_batch, **options)
+        writers.append(writer)
+        return writer
+
+    yield writer_for
+    for writer in writers:
+        writer.stop(timeout=1)
+
+
+def test_an_outage_longer_than_the_retries_loses_nothing(writer_for):
+    until = time.monotonic() + 1
+    store = FlakyStore(lambda batch: locked() if time.monotonic() < until else None)
+    writer = writer_for(store)
+    for i in range(5):
+        writer.enqueue(message(f"m{i}"))
+
+    assert writer.flush(timeout=5)
+    assert store.saved == [f"m{i}" for i in range(5)] and writer.dropped == 0
+
+
+def test_a_message_the_database_rejects_is_dropped_alone(writer_for):
+    store = FlakyStore(lambda batch: nul_rejected() if any("\x00" in m["message"] for m in batch) else None)
+    writer = writer_for(store)
+    for text in ("a", "b\x00", "c"):
+        writer.enqueue(message(text))
+
+    assert writer.flush(timeout=5)
+    assert store.saved == ["a", "c"] and writer.dropped == 1
+
+
+def test_a_full_buffer_refuses_messages(app_module, writer_for, monkeypatch):
+    store = FlakyStore(lambda batch: locked())
+    writer = writer_for(store, max_pending=3)
+    for i in range(3):
+        writer.enqueue(message(f"m{i}"))
+    with pytest.raises(RuntimeError):
+        writer.enqueue(message("m3"))
+
+    monkeypatch.setattr(app_module, "message_writer", writer)
+    assert app_module.save_message("s1", "u1", "m3", "user") is False
+    assert not writer.flush(timeout=0.1) and writer.dropped == 0
+
+
+def test_flush_session_waits_for_that_session_only(writer_for):
+    release = threading.Event()
+    store = FlakyStore(lambda batch: None if release.is_set() or batch[0]["session_id"] == "s1" else locked())
+    writer = writer_for(store, batch_size=1)
+    writer.enqueue(message("a", "s1"))
+    writer.enqueue(message("b", "s2"))
+
+    assert writer.flush_session("s1", timeout=5)
+    assert store.saved == ["a"] and writer.pending_for("s2")
+    assert not writer.flush_session("s2", timeout=0.1)
+    release.set()
+    assert writer.flush_session("s2", timeout=5) and store.saved == ["a", "b"]
+
+
+def test_a_response_ends_once_its_messages_are_committed(app_module, engine, login):
+    client = login(7)
+    client.post("/new_conversation")
+    with client.session_transaction() as session:
+        session_id = session["session_id"]
+
+    assert client.post("/process_input", json={"query": "How many vacation days do I have left?"}).status_code == 200
+    # Read as another worker would, without this process's buffer
+    with engine.connect() as conn:
+        senders = conn.execute(
+            sa.select(ChatHistory.sender).where(ChatHistory.session_id == session_id).order_by(ChatHistory.id)
+        ).scalars().all()
+    assert senders == ["user", "assistant"]
@@ -0,0 +1,64 @@
+import metrics
+from metrics import Registry, mark_process_dead
+
+
+def build(registry, hits, waiting):
+    requests = registry.counter("requests_total", "Requests", ["endpoint"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.callback_counter("cache_lookups_total", "Lookups", lambda: [(("hit",), hits)], ["result"])
+    registry.gauge("waiting", "Waiting calls", lambda: [((), waiting)])
+    return requests, latency
+
+
+def test_single_process_exposition():
+    registry = Registry()
+    requests, latency = build(registry, hits=3, waiting=2)
+    requests.inc(endpoint="chat")
+    requests.inc(2, endpoint="chat")
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{endpoint="chat"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 0.55",
+        "latency_seconds_count 2",
+        "# HELP cache_lookups_total Lookups",
+        "# TYPE cache_lookups_total counter",
+        'cache_lookups_total{result="hit"} 3',
+        "# HELP waiting Waiting calls",
+        "# TYPE waiting gauge",
+        "waiting 2",
+    ]
+
+
+def test_workers_are_merged_through_the_multiprocess_dir(tmp_path, monkeypatch):
+    workers = {}
+    for pid, hits, waiting in ((101, 3, 1), (202, 4, 5)):
+        registry = Registry(multiprocess_dir=str(tmp_path))
+        requests, latency = build(registry, hits, waiting)
+        requests.inc(pid, endpoint="chat")
+        latency.observe(0.5)
+        monkeypatch.setattr(metrics.os, "getpid", lambda pid=pid: pid)
+        registry.write()
+        workers[pid] = registry
+
+    # Whichever worker answers the scrape reports the whole server
+    monkeypatch.setattr(metrics.os, "getpid", lambda: 101)
+    text = workers[101].render()
+    assert 'requests_total{endpoint="chat"} 303' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text and "latency_seconds_count 2" in text
+    assert 'cache_lookups_total{result="hit"} 7' in text
+    assert 'waiting{pid="101"} 1' in text and 'waiting{pid="202"} 5' in text
+
+    # A worker that exits keeps counting towards the totals but no longer reports gauges
+    mark_process_dead(str(tmp_path), 202)
+    text = workers[101].render()
+    assert 'requests_total{endpoint="chat"} 303' in text
+    assert 'waiting{pid="202"}' not in text and 'waiting{pid="101"} 1' in text
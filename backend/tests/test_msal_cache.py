@@ -0,0 +1,44 @@
+import json
+import time
+
+from msal import SerializableTokenCache
+
+from msal_cache import AccountTokenStore
+
+
+def account_cache(home_account_id):
+    cache = SerializableTokenCache()
+    cache.deserialize(json.dumps({"Account": {home_account_id: {
+        "home_account_id": home_account_id, "environment": "login.bench.local", "realm": "tenant",
+        "local_account_id": home_account_id, "username": f"{home_account_id}@bench.local", "authority_type": "MSSTS",
+    }}}))
+    cache.has_state_changed = True
+    return cache
+
+
+def usernames(cache):
+    return [account["username"] for account in cache.search(SerializableTokenCache.CredentialType.ACCOUNT)]
+
+
+def test_each_account_has_its_own_cache(tmp_path):
+    store = AccountTokenStore(str(tmp_path / "tokens.db"), max_idle_days=14, sweep_interval=0)
+    store.save("a", account_cache("a"))
+    store.save("b", account_cache("b"))
+
+    assert usernames(store.load("a")) == ["a@bench.local"]
+    assert usernames(store.load("missing")) == []
+    store.delete("a")
+    assert usernames(store.load("a")) == [] and usernames(store.load("b")) == ["b@bench.local"]
+
+
+def test_idle_accounts_are_evicted(tmp_path, monkeypatch):
+    store = AccountTokenStore(str(tmp_path / "tokens.db"), max_idle_days=14, sweep_interval=0)
+    monkeypatch.setattr(time, "time", lambda: 1_000_000.0)
+    store.save("idle", account_cache("idle"))
+    store.save("active", account_cache("active"))
+    # An unchanged cache still counts as a use
+    monkeypatch.setattr(time, "time", lambda: 1_000_000.0 + 10 * 86400)
+    store.save("active", store.load("active"))
+
+    assert store.delete_idle(1_000_000.0 + 15 * 86400) == 1
+    assert usernames(store.load("idle")) == [] and usernames(store.load("active")) == ["active@bench.local"]
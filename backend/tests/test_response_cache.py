@@ -0,0 +1,71 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+VACATION = [1.0, 0.0, 0.0]
+VACATION_REPHRASED = [0.98, 0.2, 0.0]  # cosine 0.98 with VACATION
+HIRE_DATE = [0.0, 1.0, 0.0]
+POSITION = [0.0, 0.0, 1.0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_similar_queries_hit_above_the_threshold():
+    cache = ResponseCache(threshold=0.95)
+    cache.store(VACATION, "alice", "You have 12 days left.")
+
+    assert cache.lookup(VACATION_REPHRASED, "alice") == "You have 12 days left."
+    assert cache.lookup(HIRE_DATE, "alice") is None
+    assert ResponseCache(threshold=0.99).lookup(VACATION_REPHRASED, "alice") is None
+
+
+def test_answers_are_only_reused_for_the_same_context():
+    cache = ResponseCache()
+    cache.store(VACATION, "alice", "You have 12 days left.")
+
+    assert cache.lookup(VACATION, "bob") is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.store(VACATION, "alice", "You have 12 days left.")
+
+    clock[0] += 59
+    assert cache.lookup(VACATION, "alice") == "You have 12 days left."
+    clock[0] += 1
+    assert cache.lookup(VACATION, "alice") is None
+    # Expired entries are dropped when their group is scanned
+    assert cache.stats()["entries"] == 0 and cache._groups == {}
+
+
+def test_least_recently_used_entries_are_evicted_across_groups():
+    cache = ResponseCache(max_entries=2)
+    cache.store(VACATION, "alice", "alice vacation")
+    cache.store(HIRE_DATE, "bob", "bob hire date")
+    cache.lookup(VACATION, "alice")
+
+    cache.store(POSITION, "bob", "bob position")
+
+    assert cache.lookup(HIRE_DATE, "bob") is None
+    assert cache.lookup(VACATION, "alice") == "alice vacation"
+    assert cache.lookup(POSITION, "bob") == "bob position"
+    assert {key: len(ids) for key, ids in cache._groups.items()} == {"alice": 1, "bob": 1}
+
+
+def test_stats():
+    cache = ResponseCache(threshold=0.9)
+    assert cache.stats() == {"hits": 0, "misses": 0, "hit_ratio": 0.0, "entries": 0, "threshold": 0.9}
+
+    cache.store(VACATION, "alice", "You have 12 days left.")
+    cache.lookup(VACATION, "alice")
+    cache.lookup(HIRE_DATE, "alice")
+    cache.lookup(VACATION, "alice")
+    cache.lookup(VACATION, "bob")
+
+    assert cache.stats() == {"hits": 2, "misses": 2, "hit_ratio": 0.5, "entries": 1, "threshold": 0.9}
@@ -0,0 +1,106 @@
+import os
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from models import ArchivedConversation, ChatHistory, Conversation
+from retention import Retention
+
+MESSAGES = [
+    "How many vacation days can I carry over?",
+    "Up to five days carry over to next year.",
+    "Do they expire?",
+    "Carried over days expire at the end of March.",
+]
+
+
+def count(engine, table, condition):
+    with engine.connect() as conn:
+        return conn.execute(sa.select(sa.func.count()).select_from(table).where(condition)).scalar()
+
+
+def backdate(engine, session_id, when):
+    with engine.begin() as conn:
+        conn.execute(
+            sa.update(Conversation.__table__).where(Conversation.session_id == session_id).values(last_timestamp=when)
+        )
+
+
+def test_archive_restore_and_purge_round_trip(app_module, engine, login, add_conversation):
+    retention = app_module.retention
+    user_id = "user5@bench.local"
+    session_id = add_conversation(user_id, MESSAGES, datetime(2003, 5, 10))
+    live = add_conversation(user_id, ["Who approves my leave?"])
+    history_before = count(engine, ChatHistory.__table__, sa.true())
+
+    assert retention.archive_idle(datetime(2003, 6, 1)) == 1
+
+    assert count(engine, ChatHistory.__table__, sa.true()) == history_before - len(MESSAGES)
+    assert count(engine, Conversation.__table__, Conversation.session_id == session_id) == 0
+    assert count(engine, ChatHistory.__table__, ChatHistory.user_id == user_id) == 1
+    client = login(5)
+    conversations = {c["id"]: c["archived"] for c in client.get("/get_conversations").get_json()["conversations"]}
+    assert conversations == {live: False, session_id: True}
+
+    response = client.get(f"/switch_conversation/{session_id}")
+
+    assert response.status_code == 200
+    assert count(engine, ArchivedConversation.__table__, ArchivedConversation.session_id == session_id) == 0
+    with engine.connect() as conn:
+        restored = conn.execute(
+            sa.select(ChatHistory.message, ChatHistory.sender, ChatHistory.timestamp)
+            .where(ChatHistory.session_id == session_id)
+            .order_by(ChatHistory.id)
+        ).all()
+    assert [row.message for row in restored] == MESSAGES
+    assert [row.sender for row in restored] == ["user", "assistant"] * 2
+    assert {row.timestamp for row in restored} == {datetime(2003, 5, 10)}
+
+    # Archived again, then purged with the rest of its month
+    backdate(engine, session_id, datetime(2003, 5, 10))
+    assert retention.archive_idle(datetime(2003, 6, 1)) == 1
+    entry = ArchivedConversation.__table__
+    with engine.connect() as conn:
+        archive_file = conn.execute(sa.select(entry.c.archive_file).where(entry.c.session_id == session_id)).scalar()
+    assert archive_file.startswith("chat-2003-05.")
+
+    assert retention.purge_archives(datetime(2003, 7, 1)) >= 1
+
+    assert not os.path.exists(os.path.join(retention.archive_dir, archive_file))
+    assert count(engine, entry, entry.c.archive_file == archive_file) == 0
+    assert client.get(f"/switch_conversation/{session_id}").status_code == 404
+
+
+def test_failed_batch_truncates_the_archive(app_module, engine, add_conversation, tmp_path):
+    retention = Retention(engine, str(tmp_path))
+    user_id = "user6@bench.local"
+    add_conversation(user_id, MESSAGES[:2], datetime(2004, 2, 3))
+    assert retention.archive_idle(datetime(2004, 3, 1)) == 1
+    archive_path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    size = os.path.getsize(archive_path)
+
+    session_id = add_conversation(user_id, MESSAGES, datetime(2004, 2, 20))
+
+    def fail_index_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO archived_conversation"):
+            raise RuntimeError("disk full")
+
+    sa.event.listen(engine, "before_cursor_execute", fail_index_insert)
+    try:
+        with pytest.raises(RuntimeError):
+            retention.archive_idle(datetime(2004, 3, 1))
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", fail_index_insert)
+
+    # The frame is cut off and the conversation is still in the hot tables
+    assert os.path.getsize(archive_path) == size
+    assert count(engine, Conversation.__table__, Conversation.session_id == session_id) == 1
+    assert count(engine, ChatHistory.__table__, ChatHistory.session_id == session_id) == len(MESSAGES)
+
+    assert retention.archive_idle(datetime(2004, 3, 1)) == 1
+    assert os.path.getsize(archive_path) > size
+    entry = ArchivedConversation.__table__
+    with engine.connect() as conn:
+        row = conn.execute(sa.select(entry).where(entry.c.session_id == session_id)).mappings().one()
+    assert [message["message"] for message in retention.read(row)["messages"]] == MESSAGES
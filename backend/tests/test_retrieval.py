@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from retrieval import VectorIndex
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    queries = vectors[:20] + rng.normal(scale=0.05, size=(20, 16)).astype(np.float32)
+    return vectors, [f"chunk {i}" for i in range(len(vectors))], queries
+
+
+def payloads(results):
+    return [[payload for _, payload in hits] for hits in results]
+
+
+def test_flat_search_ranks_by_cosine_similarity():
+    index = VectorIndex([[1, 0], [0, 1], [1, 1]], ["x", "y", "xy"])
+
+    (hits,) = index.search([[2, 0.1]], k=2)
+
+    assert [payload for _, payload in hits] == ["x", "xy"]
+    assert hits[0][0] == pytest.approx(2 / np.hypot(2, 0.1))
+    assert payloads(VectorIndex([], []).search([[1, 0]], k=3)) == [[]]
+
+
+def test_ivf_probing_every_cell_matches_flat(corpus):
+    vectors, texts, queries = corpus
+    flat = VectorIndex(vectors, texts)
+    ivf = VectorIndex(vectors, texts, mode="ivf", nlist=8, nprobe=8)
+
+    assert payloads(ivf.search(queries, k=5)) == payloads(flat.search(queries, k=5))
+    # With fewer probes the nearest neighbour is still in the query's own cell
+    assert [hits[0] for hits in payloads(VectorIndex(vectors, texts, mode="ivf", nlist=8, nprobe=2).search(queries))] \
+        == texts[:20]
+
+
+def test_quantized_scores_stay_close_to_float(corpus, monkeypatch):
+    vectors, texts, queries = corpus
+    # Several score blocks even for this small corpus
+    monkeypatch.setattr(VectorIndex, "SCORE_BLOCK", 64)
+    flat = VectorIndex(vectors, texts)
+    quantized = VectorIndex(vectors, texts, quantize=True)
+
+    assert quantized._matrix.dtype == np.int8
+    for exact, approximate in zip(flat.search(queries, k=3), quantized.search(queries, k=3)):
+        assert approximate[0][1] == exact[0][1]
+        assert approximate[0][0] == pytest.approx(exact[0][0], abs=0.02)
+
+
+def test_empty_cells_are_skipped():
+    # Duplicate vectors give k-means identical centroids, one of which keeps no members
+    index = VectorIndex([[1, 0]] * 6 + [[0, 1]], list(range(7)), mode="ivf", nlist=3, nprobe=2)
+    assert any(len(cell) == 0 for cell in index._cells)
+
+    near_x, near_y = index.search([[1, 0.1], [0.1, 1]], k=2)
+
+    assert len(near_x) == 2 and {payload for _, payload in near_x} <= set(range(6))
+    assert near_y[0][1] == 6
@@ -0,0 +1,152 @@
+import time
+
+import pytest
+from flask import Flask, session
+from itsdangerous import Signer
+
+import session_store
+from session_store import MemorySessionBackend, ServerSideSessionInterface, SQLiteSessionBackend
+
+LIFETIME = 3600
+
+
+class RecordingBackend(MemorySessionBackend):
+    """Memory backend that records which calls reach it."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def load(self, sid, known_version=None):
+        row = super().load(sid, known_version)
+        self.calls.append(("load", row is not None and row[2] is not None))
+        return row
+
+    def save(self, sid, data, expires_at):
+        self.calls.append(("save", sid))
+        return super().save(sid, data, expires_at)
+
+    def touch(self, sid, expires_at):
+        self.calls.append(("touch", sid))
+        super().touch(sid, expires_at)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def backend():
+    return RecordingBackend()
+
+
+@pytest.fixture
+def client(backend):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.config["PERMANENT_SESSION_LIFETIME"] = LIFETIME
+    app.session_interface = ServerSideSessionInterface(backend, sweep_interval=0)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session["value"] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return session.get("value", "")
+
+    @app.route("/login")
+    def login():
+        session.regenerate()
+        session["user"] = "user0@bench.local"
+        return "ok"
+
+    return app.test_client()
+
+
+def session_id(client):
+    cookie = client.get_cookie("session")
+    return Signer("test", salt="server-side-session").unsign(cookie.value).decode("utf-8")
+
+
+def test_the_cookie_only_carries_the_signed_session_id(client, backend):
+    client.get("/set/confidential")
+
+    cookie = client.get_cookie("session").value
+    sid = session_id(client)
+    assert "confidential" not in cookie and cookie.startswith(sid + ".")
+    assert client.get("/get").text == "confidential"
+    assert "confidential" in backend.load(sid)[2]
+
+
+def test_regenerate_moves_the_session_and_deletes_the_old_row(client, backend):
+    client.get("/set/before")
+    old_sid = session_id(client)
+
+    client.get("/login")
+
+    assert session_id(client) != old_sid
+    assert backend.load(old_sid) is None
+    assert client.get("/get").text == "before"
+
+
+def test_expiry_slides_through_touch(client, backend, clock):
+    client.get("/set/value")
+    sid = session_id(client)
+
+    # Reads in the first half of the lifetime write nothing
+    clock[0] += LIFETIME / 4
+    client.get("/get")
+    assert backend.calls[-1][0] == "load"
+
+    clock[0] += LIFETIME / 2
+    client.get("/get")
+    assert backend.calls[-1] == ("touch", sid)
+    assert backend.load(sid)[1] == clock[0] + LIFETIME
+
+    clock[0] += LIFETIME + 1
+    assert client.get("/get").text == ""
+
+
+def test_a_known_version_skips_the_payload(client, backend):
+    client.get("/set/value")
+    assert client.get("/get").text == client.get("/get").text == "value"
+    # Written by another worker: the stored version no longer matches the cached one
+    backend.save(session_id(client), '{"value": "changed"}', time.time() + LIFETIME)
+    assert client.get("/get").text == "changed"
+
+    assert [call for call in backend.calls if call[0] == "load"] == [("load", False)] * 2 + [("load", True)]
+
+
+@pytest.mark.parametrize("make_backend", [
+    MemorySessionBackend,
+    lambda tmp_path: SQLiteSessionBackend(str(tmp_path / "sessions.db")),
+], ids=["memory", "sqlite"])
+def test_backends_version_rows_and_delete_expired_ones(make_backend, tmp_path):
+    backend = make_backend() if make_backend is MemorySessionBackend else make_backend(tmp_path)
+    version = backend.save("a", '{"value": 1}', 100.0)
+    backend.save("b", '{"value": 2}', 300.0)
+
+    assert tuple(backend.load("a")) == (version, 100.0, '{"value": 1}')
+    assert tuple(backend.load("a", known_version=version)) == (version, 100.0, None)
+    assert backend.save("a", '{"value": 3}', 100.0) != version
+
+    assert backend.delete_expired(200.0) == 1
+    assert backend.load("a") is None and backend.load("b") is not None
+
+
+def test_the_sweeper_removes_idle_sessions():
+    backend = MemorySessionBackend()
+    backend.save("idle", "{}", time.time() - 1)
+    backend.save("active", "{}", time.time() + LIFETIME)
+
+    ServerSideSessionInterface(backend, sweep_interval=0.01)
+    deadline = time.monotonic() + 5
+    while backend.load("idle") is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert backend.load("idle") is None and backend.load("active") is not None
@@ -0,0 +1,124 @@
+"""Chat storage on the configured database (SQLite, or TEST_DATABASE_URL)."""
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+import migrations
+from models import ChatHistory, Conversation
+from session_store import SQLAlchemySessionBackend
+
+
+def test_migrations_are_recorded_and_idempotent(engine):
+    assert migrations.run_migrations(engine) == []
+    with engine.connect() as conn:
+        versions = conn.execute(sa.select(migrations.schema_version.c.version)).scalars().all()
+    assert sorted(versions) == [version for version, _, _ in migrations.MIGRATIONS]
+
+
+def test_database_lock_is_held_across_connections(engine):
+    with engine.connect() as first, engine.connect() as second:
+        with migrations.database_lock(first, "test", 4_204_299) as acquired:
+            assert acquired
+            with migrations.database_lock(second, "test", 4_204_299, blocking=False) as acquired:
+                assert not acquired
+        with migrations.database_lock(second, "test", 4_204_299, blocking=False) as acquired:
+            assert acquired
+
+
+def test_database_lock_is_released_when_its_holder_dies(engine):
+    holder = subprocess.Popen(
+        [sys.executable, "-c", (
+            "import sys, time, sqlalchemy as sa, migrations\n"
+            "with sa.create_engine(sys.argv[1]).connect() as conn, "
+            "migrations.database_lock(conn, 'test', 4_204_298):\n"
+            "    print('locked', flush=True)\n"
+            "    time.sleep(60)\n"
+        ), engine.url.render_as_string(hide_password=False)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        with engine.connect() as conn, migrations.database_lock(conn, "test", 4_204_298, blocking=False) as acquired:
+            assert not acquired
+    finally:
+        holder.kill()
+        holder.wait()
+
+    with engine.connect() as conn, migrations.database_lock(conn, "test", 4_204_298, blocking=False) as acquired:
+        assert acquired
+
+
+def test_search_highlights_matches_in_the_users_own_history(app_module, login, add_conversation):
+    user_id = "user1@bench.local"
+    add_conversation(user_id, ["How do I request parental leave?", "Parental leave is requested in the portal."])
+    add_conversation("user2@bench.local", ["Is parental leave paid?"])
+    assert app_module.search_backend in ("fts5", "tsvector")
+
+    response = login(1).get("/search_conversations", query_string={"q": "parental"})
+
+    results = response.get_json()["results"]
+    assert response.status_code == 200 and len(results) == 2
+    assert all("<mark>" in result["snippet_html"].lower() for result in results)
+    assert {result["sender"] for result in results} == {"user", "assistant"}
+
+
+def test_conversation_list_merges_live_and_archived(app_module, login, add_conversation):
+    user_id = "user3@bench.local"
+    old = add_conversation(user_id, ["When does my contract end?", "It ends in June."], datetime(2001, 1, 15))
+    live = add_conversation(user_id, ["How many vacation days do I have left?"])
+    assert app_module.retention.archive_idle(datetime(2001, 2, 1)) >= 1
+
+    response = login(3).get("/get_conversations")
+
+    conversations = {c["id"]: c for c in response.get_json()["conversations"]}
+    assert response.status_code == 200
+    assert conversations[live]["archived"] is False
+    assert conversations[old]["archived"] is True
+    assert list(conversations) == [live, old]
+
+
+def test_session_backend_round_trip(engine):
+    backend = SQLAlchemySessionBackend(engine.url.render_as_string(hide_password=False))
+    expires_at = time.time() + 60
+
+    version = backend.save("sid-1", '{"user": 1}', expires_at)
+    assert backend.load("sid-1") == (version, expires_at, '{"user": 1}')
+    # A known version skips the payload
+    assert backend.load("sid-1", known_version=version)[2] is None
+
+    new_version = backend.save("sid-1", '{"user": 2}', expires_at)
+    assert new_version != version and backend.load("sid-1", known_version=version)[2] == '{"user": 2}'
+
+    backend.save("sid-2", "{}", time.time() - 1)
+    assert backend.delete_expired(time.time()) == 1
+    assert backend.load("sid-2") is None
+    backend.delete("sid-1")
+    assert backend.load("sid-1") is None
+
+
+def test_legacy_history_goes_to_an_object_id_and_can_be_reassigned(engine, add_conversation):
+    first, second = "3f2b9c4e-8a1d-4e6f-9b7a-0c5d2e1f4a38", "0b6e1d52-7c3a-4f9e-8d21-5a4c3b2e1f60"
+    session_id = add_conversation(None, ["Legacy question", "Legacy answer"])
+
+    def owners():
+        with engine.connect() as conn:
+            return (
+                set(conn.execute(sa.select(ChatHistory.user_id).where(ChatHistory.session_id == session_id)).scalars()),
+                conn.execute(sa.select(Conversation.user_id).where(Conversation.session_id == session_id)).scalar(),
+            )
+
+    with engine.begin() as conn:
+        migrations.assign_owners(conn, "alice@example.com")
+    assert owners() == ({None}, None)
+
+    with engine.begin() as conn:
+        migrations.assign_owners(conn, first)
+    assert owners() == ({first}, first)
+
+    with engine.begin() as conn:
+        assert migrations.reassign_owner(conn, first, second) == 3
+    assert owners() == ({second}, second)
@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+
+from models import ChatHistory
+
+
+def events(chunks):
+    """Parse Server-Sent Events, checking that every event is a single framed data line."""
+    body = b"".join(chunks).decode("utf-8")
+    assert body.endswith("\n\n")
+    frames = body[:-2].split("\n\n")
+    assert all(frame.startswith("data: ") and "\n" not in frame for frame in frames)
+    return [json.loads(frame[len("data: "):]) for frame in frames]
+
+
+def start_conversation(client):
+    client.post("/new_conversation")
+    with client.session_transaction() as session:
+        return session["session_id"]
+
+
+def assistant_messages(engine, session_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(ChatHistory.message)
+            .where(ChatHistory.session_id == session_id, ChatHistory.sender == "assistant")
+        ).scalars().all()
+
+
+def record_cache_stores(app_module, monkeypatch):
+    stored = []
+    monkeypatch.setattr(app_module.response_cache, "store", lambda embedding, key, response: stored.append(response))
+    return stored
+
+
+def chunk(content):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def test_a_full_stream_is_saved_and_cached(app_module, engine, login, monkeypatch):
+    stored = record_cache_stores(app_module, monkeypatch)
+    client = login(8)
+    session_id = start_conversation(client)
+
+    response = client.post("/process_input", json={"query": "When does my parental leave start?", "stream": True})
+
+    assert response.status_code == 200 and response.mimetype == "text/event-stream"
+    received = events(response.response)
+    answer = "".join(event["delta"] for event in received[:-1])
+    assert received[-1] == {"done": True} and len(received) > 2
+    assert assistant_messages(engine, session_id) == [answer]
+    assert stored == [answer]
+
+
+def test_a_disconnected_client_keeps_the_partial_answer(app_module, engine, login, monkeypatch):
+    stored = record_cache_stores(app_module, monkeypatch)
+    client = login(9)
+    session_id = start_conversation(client)
+
+    response = client.post(
+        "/process_input", json={"query": "Who is my HR contact?", "stream": True}, buffered=False
+    )
+    chunks = iter(response.response)
+    received = events([next(chunks), next(chunks)])
+    response.close()
+
+    assert assistant_messages(engine, session_id) == ["".join(event["delta"] for event in received)]
+    assert stored == []
+
+
+def test_a_failed_stream_ends_with_an_error_event(app_module, engine, login, monkeypatch):
+    stored = record_cache_stores(app_module, monkeypatch)
+
+    def failing_stream(*args, **kwargs):
+        yield chunk("You have ")
+        raise ConnectionError("upstream closed the connection")
+
+    monkeypatch.setattr(app_module.llm, "chat", failing_stream)
+    client = login(10)
+    session_id = start_conversation(client)
+
+    response = client.post("/process_input", json={"query": "How many days did I take?", "stream": True})
+
+    assert events(response.response) == [{"delta": "You have "}, {"error": "Failed to generate response"}]
+    assert assistant_messages(engine, session_id) == ["You have "]
+    assert stored == []
@@ -0,0 +1,19 @@
+# Entry point for production servers. Patch the standard library before
+# anything else is imported so that sockets used by the OpenAI and MSAL
+# clients yield to other requests while waiting on the network.
+from gevent import monkey
+
+monkey.patch_all()
+
+# psycopg2 talks to PostgreSQL in C, out of gevent's reach; psycogreen makes
+# it yield while waiting on the server (only needed with a PostgreSQL DATABASE_URL)
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:
+    pass
+else:
+    patch_psycopg()
+
+from app import app  # noqa: E402
+
+application = app
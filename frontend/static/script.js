@@ -43,16 +43,20 @@ async function processInput() {
         addMessageToUI('user', query);
         scrollToBottom();
 
-        // Send query to backend and get response
+        // Send query to backend and stream the response
         const response = await fetch('/process_input', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ query })
+            body: JSON.stringify({ query, stream: true })
         });
 
-        if (!response.ok) throw new Error('Network response was not ok');
+        const contentType = response.headers.get('Content-Type') || '';
+        if (response.ok && contentType.startsWith('text/event-stream')) {
+            await renderStreamedResponse(response);
+            return;
+        }
 
         const data = await response.json();
         hideTypingIndicator();
@@ -78,6 +82,42 @@ async function processInput() {
     }
 }
 
+// Read Server-Sent Events from the response body and append deltas as they arrive
+async function renderStreamedResponse(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let bubble = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const event of events) {
+            if (!event.startsWith('data: ')) continue;
+            const payload = JSON.parse(event.slice(6));
+
+            if (payload.error) {
+                hideTypingIndicator();
+                addMessageToUI('assistant', `Error: ${payload.error}`);
+            } else if (payload.delta) {
+                if (!bubble) {
+                    hideTypingIndicator();
+                    bubble = addMessageToUI('assistant', '').querySelector('.message-bubble');
+                }
+                bubble.textContent += payload.delta;
+            }
+        }
+        scrollToBottom();
+    }
+
+    hideTypingIndicator();
+}
+
 function addMessageToUI(sender, message) {
     const chatWindow = document.getElementById('chat-window');
     const messageDiv = document.createElement('div');
@@ -103,8 +143,79 @@ function addMessageToUI(sender, message) {
     `;
 
     chatWindow.appendChild(messageDiv);
+    return messageDiv;
+}
+
+// Build a message element for history loaded from the server
+function createHistoryMessage(message) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${message.sender}`;
+    messageDiv.setAttribute('data-id', message.id);
+
+    const time = new Date(message.timestamp).toLocaleTimeString('en-US', {
+        hour: '2-digit',
+        minute: '2-digit',
+        hour12: false
+    });
+
+    messageDiv.innerHTML = `
+        ${message.sender === 'assistant' ? `
+            <div class="avatar">
+                <img src="/static/assistant-avatar.jpg" alt="Assistant">
+            </div>
+        ` : ''}
+        <div class="message-content">
+            <div class="message-bubble"></div>
+            <div class="message-info">
+                <span class="timestamp">${time}</span>
+            </div>
+        </div>
+    `;
+    messageDiv.querySelector('.message-bubble').textContent = message.message;
+    return messageDiv;
+}
+
+// Older messages are fetched page by page when the chat is scrolled to the top
+let historyLoading = false;
+
+async function loadOlderMessages() {
+    const chatWindow = document.getElementById('chat-window');
+    const oldest = chatWindow.querySelector('.message[data-id]');
+    if (historyLoading || chatWindow.dataset.hasMore !== 'true' || !oldest) return;
+    historyLoading = true;
+
+    try {
+        const params = new URLSearchParams({ before: oldest.dataset.id, limit: 30 });
+        const response = await fetch(`/chat_history?${params}`);
+        if (!response.ok) throw new Error('Network response was not ok');
+
+        const data = await response.json();
+        if (data.status !== 'success') throw new Error(data.error);
+
+        // Messages arrive newest first: insert each one above the previous
+        const previousHeight = chatWindow.scrollHeight;
+        let anchor = oldest;
+        data.messages.forEach(message => {
+            const messageDiv = createHistoryMessage(message);
+            chatWindow.insertBefore(messageDiv, anchor);
+            anchor = messageDiv;
+        });
+        chatWindow.scrollTop += chatWindow.scrollHeight - previousHeight;
+        chatWindow.dataset.hasMore = data.has_more ? 'true' : 'false';
+    } catch (error) {
+        console.error('Error:', error);
+        showError('Failed to load older messages.');
+    } finally {
+        historyLoading = false;
+    }
 }
 
+document.getElementById('chat-window').addEventListener('scroll', (e) => {
+    if (e.target.scrollTop < 50) {
+        loadOlderMessages();
+    }
+});
+
 function formatRowsForDisplay(rows) {
     return rows.map((row, index) => {
         return `Row ${index + 1}: ${JSON.stringify(row)}`;
@@ -303,6 +414,11 @@ if (conversationsBtn) {
     conversationsBtn.addEventListener("click", () => {
         conversationsSidebar.classList.add("active");
         createSidebarOverlay();
+        if (conversationSearch && conversationSearch.value.trim()) {
+            conversationSearch.value = '';
+            searchQuery = '';
+            searchOffset = null;
+        }
         loadConversations();
     });
 }
@@ -352,12 +468,24 @@ function removeSidebarOverlay() {
     }
 }
 
-// Load conversations from the server
-async function loadConversations() {
+// Cursor of the next conversations page, null once everything is loaded
+let conversationsCursor = null;
+let conversationsLoading = false;
+
+// Load conversations from the server, one page at a time
+async function loadConversations(cursor = null) {
+    if (conversationsLoading) return;
+    conversationsLoading = true;
+
     try {
-        conversationsList.innerHTML = '<div class="loading-spinner">Loading conversations...</div>';
-        
-        const response = await fetch('/get_conversations', {
+        if (!cursor) {
+            conversationsList.innerHTML = '<div class="loading-spinner">Loading conversations...</div>';
+        }
+
+        const params = new URLSearchParams({ limit: 20 });
+        if (cursor) params.set('cursor', cursor);
+
+        const response = await fetch(`/get_conversations?${params}`, {
             method: 'GET',
             headers: {
                 'Content-Type': 'application/json',
@@ -369,24 +497,127 @@ async function loadConversations() {
         const data = await response.json();
         
         if (data.status === "success") {
-            displayConversations(data.conversations);
+            displayConversations(data.conversations, Boolean(cursor));
+            conversationsCursor = data.next_cursor;
         } else {
             conversationsList.innerHTML = '<div class="error">Failed to load conversations</div>';
         }
     } catch (error) {
         console.error('Error:', error);
         conversationsList.innerHTML = '<div class="error">Failed to load conversations</div>';
+    } finally {
+        conversationsLoading = false;
     }
 }
 
+// Fetch the next page when the sidebar list is scrolled to the bottom
+if (conversationsList) {
+    conversationsList.addEventListener('scroll', () => {
+        const nearBottom = conversationsList.scrollTop + conversationsList.clientHeight >= conversationsList.scrollHeight - 50;
+        if (!nearBottom) return;
+        if (searchQuery) {
+            if (searchOffset !== null) searchConversations(searchQuery, searchOffset);
+        } else if (conversationsCursor) {
+            loadConversations(conversationsCursor);
+        }
+    });
+}
+
+// Full-text search over the user's messages; an empty box shows the conversation list again
+const conversationSearch = document.getElementById("conversation-search");
+let searchQuery = '';
+let searchOffset = null;
+let searchTimer = null;
+let searchLoading = false;
+
+if (conversationSearch) {
+    conversationSearch.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            searchQuery = conversationSearch.value.trim();
+            searchOffset = null;
+            if (searchQuery) {
+                searchConversations(searchQuery);
+            } else {
+                loadConversations();
+            }
+        }, 250);
+    });
+}
+
+async function searchConversations(query, offset = 0) {
+    // A new query always runs; only the next-page requests are serialized
+    if (offset > 0 && searchLoading) return;
+    searchLoading = true;
+
+    try {
+        const params = new URLSearchParams({ q: query, limit: 20, offset });
+        const response = await fetch(`/search_conversations?${params}`);
+        const data = await response.json();
+
+        // Ignore answers to a query the user has already changed
+        if (query !== searchQuery) return;
+
+        if (!response.ok || data.status !== "success") {
+            conversationsList.innerHTML = `<div class="error"></div>`;
+            conversationsList.firstChild.textContent = data.error || 'Search failed';
+            return;
+        }
+        displaySearchResults(data.results, offset > 0);
+        searchOffset = data.next_offset;
+    } catch (error) {
+        console.error('Error:', error);
+        conversationsList.innerHTML = '<div class="error">Search failed</div>';
+    } finally {
+        if (query === searchQuery) searchLoading = false;
+    }
+}
+
+function displaySearchResults(results, append = false) {
+    if (!append) {
+        conversationsList.innerHTML = '';
+        if (results.length === 0) {
+            conversationsList.innerHTML = '<div class="no-conversations">No matching messages</div>';
+            return;
+        }
+    }
+
+    results.forEach(result => {
+        const item = document.createElement('div');
+        item.className = 'conversation-item search-result';
+        item.setAttribute('data-id', result.conversation_id);
+
+        const date = new Date(result.timestamp);
+        const title = document.createElement('div');
+        title.className = 'conversation-title';
+        title.textContent = result.title || 'Conversation';
+
+        // snippet_html is escaped server-side; only <mark> tags are markup
+        const snippet = document.createElement('div');
+        snippet.className = 'search-snippet';
+        snippet.innerHTML = result.snippet_html;
+
+        const timestamp = document.createElement('div');
+        timestamp.className = 'conversation-timestamp';
+        timestamp.textContent = date.toLocaleDateString() + ' ' +
+                                date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+
+        item.append(title, snippet, timestamp);
+        item.addEventListener('click', () => switchConversation(result.conversation_id));
+        conversationsList.appendChild(item);
+    });
+}
+
 // Display conversations in the sidebar
-function displayConversations(conversations) {
-    if (conversations.length === 0) {
+function displayConversations(conversations, append = false) {
+    if (!append && conversations.length === 0) {
         conversationsList.innerHTML = '<div class="no-conversations">No conversations yet</div>';
         return;
     }
     
-    conversationsList.innerHTML = '';
+    if (!append) {
+        conversationsList.innerHTML = '';
+    }
     
     conversations.forEach(conversation => {
         const conversationItem = document.createElement('div');
@@ -399,7 +630,7 @@ function displayConversations(conversations) {
         
         conversationItem.innerHTML = `
             <div class="conversation-title">${conversation.title}</div>
-            <div class="conversation-timestamp">${formattedDate}</div>
+            <div class="conversation-timestamp">${formattedDate}${conversation.archived ? ' · Archived' : ''}</div>
         `;
         
         conversationItem.addEventListener('click', () => switchConversation(conversation.id));